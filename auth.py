@@ -0,0 +1,121 @@
+import time
+from functools import wraps
+from typing import Any, Callable, Optional, Tuple
+
+from flask import g, jsonify, redirect, request, session
+
+from cache import LRUCache
+from storage import db
+from storage.models import User
+from env import ADMIN_EMAIL
+from config import USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS
+
+# email -> (expiry, user). Unknown emails aren't cached, since another process
+# may add the user at any moment and the login link must find them straight away.
+_users: LRUCache[Tuple[float, User]] = LRUCache(USER_CACHE_SIZE)
+
+
+def get_user(email: str) -> Optional[User]:
+    """
+    A user record, read from the database at most once per USER_CACHE_TTL_SECONDS.
+    Changes made in this process show up at once; other processes see them when
+    their copy expires.
+    """
+    now = time.monotonic()
+    entry = _users.get(email)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    user = db.get_user(email)
+    if user is not None:
+        _users.put(email, (now + USER_CACHE_TTL_SECONDS, user))
+    return user
+
+
+def invalidate_user(email: str) -> None:
+    _users.discard(email)
+
+
+db.add_user_listener(invalidate_user)
+
+
+def is_admin(user: Optional[User]) -> bool:
+    return user is not None and user.email == ADMIN_EMAIL
+
+
+def current_user() -> Optional[User]:
+    """The logged-in user, resolved once per request."""
+    if "user" not in g:
+        email = session.get("email")
+        g.user = get_user(email) if email else None
+    return g.user
+
+
+def log_in(email: str) -> None:
+    """Make email the session's user, e.g. after a magic link or impersonation."""
+    invalidate_user(email)
+    session["email"] = email
+    g.pop("user", None)
+
+
+def log_out() -> None:
+    session.pop("email", None)
+    g.pop("user", None)
+
+
+def not_logged_in(api: bool):
+    if api:
+        return jsonify({"error": "Not logged in"}), 401
+    return redirect("/login")
+
+
+def login_required(view: Optional[Callable] = None, *, api: bool = False):
+    """
+    Run a view only for a logged-in user, who is passed to it as `user`.
+    Anyone else is sent to /login, or gets a JSON 401 for an api view.
+    """
+    def decorate(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args: Any, **kwargs: Any):
+            user = current_user()
+            if user is None:
+                return not_logged_in(api)
+            return view(*args, user=user, **kwargs)
+        return wrapper
+    return decorate(view) if view is not None else decorate
+
+
+def admin_required(view: Callable) -> Callable:
+    """Run a view only for the admin, who is passed to it as `user`."""
+    @wraps(view)
+    def wrapper(*args: Any, **kwargs: Any):
+        user = current_user()
+        if not is_admin(user):
+            if user is None or request.method == "GET":
+                return not_logged_in(api=False)
+            return "Unauthorized", 403
+        return view(*args, user=user, **kwargs)
+    return wrapper
+
+
+def owns(user: User, owner_id: Optional[int], admin_allowed: bool = False) -> bool:
+    """Whether user may see a record belonging to owner_id."""
+    return owner_id == user.id or (admin_allowed and is_admin(user))
+
+
+def owner_required(name: str, load: Callable[[int], Optional[Any]], not_found: str):
+    """
+    Load the record named by the view's `<name>_id` argument and run the view
+    with it as `name`, only if it belongs to the logged-in user. Saves each view
+    looking the user and record up itself.
+    """
+    def decorate(view: Callable) -> Callable:
+        @wraps(view)
+        @login_required
+        def wrapper(*args: Any, user: User, **kwargs: Any):
+            record = load(kwargs[f"{name}_id"])
+            if record is None or not owns(user, record.user_id):
+                return not_found, 404
+            kwargs[name] = record
+            return view(*args, user=user, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,155 @@
+"""
+Deterministic synthetic solicitations and filters for benchmarks.
+
+Records look like what the scrapers store: EVP rows with long descriptions and
+"MM/DD/YYYY HH:MM AM" dates, ESBD rows with short titles, plain "MM/DD/YYYY"
+dates and no description. Departments follow a long-tailed distribution, as a
+few large agencies post most solicitations. Filters are criteria trees shaped
+like the ones the filter editor saves.
+"""
+import json
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+from data_sources.Solicitation import Solicitation, Solicitations
+from storage.models import Filter
+
+EVP_ENTITY = "evp_solicitation"
+ESBD_ENTITY = "TXSMARTBUY_ESBD"
+# Share of records that come from EVP; the rest are ESBD
+EVP_SHARE = 0.4
+
+DEPARTMENTS = [
+    "Department of Transportation", "Department of Health and Human Services",
+    "Department of Public Safety", "Department of Information Technology",
+    "Department of Administration", "Department of Environmental Quality",
+    "Department of Adult Correction", "University of North Carolina at Chapel Hill",
+    "North Carolina State University", "Texas Department of Criminal Justice",
+    "Texas Health and Human Services Commission", "Texas Department of Transportation",
+    "Texas Parks and Wildlife Department", "Texas Facilities Commission",
+    "Comptroller of Public Accounts", "Department of State Health Services",
+    "Texas A&M University System", "University of Texas at Austin",
+    "Department of Natural and Cultural Resources", "Wildlife Resources Commission",
+    "Office of the Attorney General", "Texas Workforce Commission",
+    "Department of Commerce", "Department of Revenue", "General Land Office",
+    "Texas Water Development Board", "Department of Insurance", "Lottery Commission",
+    "Department of Military and Veterans Affairs", "Texas Education Agency",
+]
+
+TITLE_PREFIXES = ["", "", "", "RFP - ", "IFB - ", "RFQ: ", "Request for Proposals for ", "Term Contract for "]
+SUBJECTS = [
+    "Janitorial Services", "Roofing Replacement", "HVAC Maintenance", "Network Switches",
+    "Body Worn Cameras", "Fleet Vehicles", "Office Furniture", "Laboratory Supplies",
+    "Bridge Inspection", "Road Resurfacing", "Cloud Hosting", "Cybersecurity Assessment",
+    "Medical Equipment", "Food Service", "Uniforms", "Security Guard Services",
+    "Mowing and Landscaping", "Elevator Maintenance", "Software Licenses", "Printing Services",
+    "Traffic Signal Upgrades", "Water Treatment Chemicals", "Consulting Services",
+    "Fire Alarm Testing", "Pest Control", "Courier Services", "Data Center Cooling",
+]
+LOCATIONS = ["", "", "Statewide", "District 4", "Region 7", "Austin", "Raleigh", "Houston",
+             "Wake County", "Harris County", "Main Campus"]
+STATUSES = ["Posted", "Posted", "Posted", "Addendum Posted", "Closed", "Awarded", "Cancelled"]
+WORDS = ("the contractor shall provide all labor materials equipment and supervision necessary "
+         "to perform services in accordance with the specifications attached scope of work "
+         "including inspection reporting warranty and compliance with state and federal "
+         "requirements bids must be submitted electronically before the closing date").split()
+
+CONDITION_FIELDS = ["title", "title", "title", "description", "department", "department", "posted_date"]
+OPERATORS = ["contains", "contains", "contains", "equals", "startsWith", "endsWith"]
+DATE_RANGES = ["last_1_day", "last_3_days", "last_7_days"]
+
+
+def department(rng: random.Random) -> str:
+    # Roughly Zipfian: the first few agencies post most of the solicitations
+    return DEPARTMENTS[min(int(rng.paretovariate(1.2)) - 1, len(DEPARTMENTS) - 1)]
+
+
+def title(rng: random.Random) -> str:
+    location = rng.choice(LOCATIONS)
+    return f"{rng.choice(TITLE_PREFIXES)}{rng.choice(SUBJECTS)}{f' - {location}' if location else ''}"
+
+
+def description(rng: random.Random) -> str:
+    """A few paragraphs of EVP-style prose, 1-4 KB."""
+    paragraphs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))).capitalize() + "."
+                  for _ in range(rng.randint(1, 4))]
+    return "\n\n".join(paragraphs)
+
+
+def posted_day(rng: random.Random, today: date) -> date:
+    # Most solicitations are recent; a tail goes back a few months
+    return today - timedelta(days=min(int(rng.expovariate(1 / 10)), 120))
+
+
+def make_solicitation(rng: random.Random, i: int, today: date) -> Solicitation:
+    posted = posted_day(rng, today)
+    opens = posted + timedelta(days=rng.randint(7, 45))
+    if rng.random() < EVP_SHARE:
+        return Solicitation(
+            Id=f"{rng.getrandbits(128):032x}",
+            EntityName=EVP_ENTITY,
+            state="Open",
+            open_date=f"{opens:%m/%d/%Y} {rng.randint(1, 12)}:{rng.choice(['00', '30'])} {rng.choice(['AM', 'PM'])}",
+            department=department(rng),
+            posted_date=f"{posted:%m/%d/%Y} {rng.randint(1, 12)}:{rng.choice(['00', '15', '30', '45'])} AM",
+            solicitation_id=f"{rng.getrandbits(128):032x}",
+            title=title(rng),
+            status=rng.choice(STATUSES),
+            solicitation_number=f"{rng.randint(10, 99)}-{rng.choice(['RFP', 'IFB', 'RFQ'])}-{i:06d}",
+            description=description(rng),
+        )
+    number = f"{rng.randint(100, 999)}-{posted:%y}-{i:06d}"
+    return Solicitation(
+        Id=str(1000000 + i),
+        EntityName=ESBD_ENTITY,
+        solicitation_id=str(1000000 + i),
+        solicitation_number=number,
+        title=title(rng),
+        description="",
+        department=department(rng),
+        status=rng.choice(STATUSES),
+        open_date=f"{posted:%m/%d/%Y}",
+        posted_date=f"{posted:%m/%d/%Y}",
+        url=f"https://www.txsmartbuy.gov/esbd/{number}",
+    )
+
+
+def make_corpus(size: int, seed: int = 0) -> Solicitations:
+    """size solicitations, the same ones every call with the same seed."""
+    rng = random.Random(seed)
+    today = date.today()
+    return Solicitations(make_solicitation(rng, i, today) for i in range(size))
+
+
+def make_condition(rng: random.Random) -> Dict[str, Any]:
+    field = rng.choice(CONDITION_FIELDS)
+    if field == "posted_date":
+        return {"field": field, "operator": "contains", "invert": False, "value": rng.choice(DATE_RANGES)}
+    if field == "department":
+        value = department(rng) if rng.random() < 0.5 else department(rng).split()[-1]
+    else:
+        value = rng.choice(SUBJECTS).split()[0] if rng.random() < 0.7 else rng.choice(WORDS)
+    return {"field": field, "operator": rng.choice(OPERATORS), "invert": rng.random() < 0.1, "value": value}
+
+
+def make_group(rng: random.Random, depth: int) -> Dict[str, Any]:
+    conditions: List[Dict[str, Any]] = []
+    for _ in range(rng.randint(1, 4)):
+        if depth < 2 and rng.random() < 0.25:
+            conditions.append(make_group(rng, depth + 1))
+        else:
+            conditions.append(make_condition(rng))
+    return {"op": rng.choice(["AND", "OR"]) if depth else "AND", "conditions": conditions}
+
+
+def make_criteria(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """count criteria trees: a root AND group of 1-4 conditions, sometimes with nested groups."""
+    rng = random.Random(seed)
+    return [make_group(rng, 0) for _ in range(count)]
+
+
+def make_filters(count: int, seed: int = 0) -> List[Filter]:
+    """Saved filters, with criteria stored as JSON like the filters table holds them."""
+    return [Filter(id=i + 1, user_id=1, name=f"Filter {i + 1}", criteria=json.dumps(criteria))
+            for i, criteria in enumerate(make_criteria(count, seed))]
@@ -0,0 +1,259 @@
+"""
+Local stand-ins for the ESBD and EVP endpoints the scrapers call, for benchmarking
+refreshes under controlled load.
+
+ESBD (ESBD.Service.ss pages and ESBD.Details.Service.ss descriptions) and EVP
+(entity-grid-data.json) are served on separate ports, as they are separate
+hosts to the scrapers' per-host throttling. Point ESBD_BASE_URL and
+EVP_BASE_URL at them, with EVP_USE_BROWSER = False.
+
+    python -m bench.fake_sources [--esbd-records 5000] [--evp-records 800]
+                                 [--latency 0.05] [--error-rate 0.01] [--gzip auto]
+
+GET /_stats on either port returns request counts so far.
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from bench.corpus import STATUSES, department, description, posted_day, title
+
+ESBD_PATH = "/app/extensions/CPA/CPAMain/1.0.0/services/ESBD.Service.ss"
+DETAILS_PATH = "/app/extensions/CPA/CPAMain/1.0.0/services/ESBD.Details.Service.ss"
+GRID_PATH = "/_services/entity-grid-data.json/"
+STATS_PATH = "/_stats"
+
+
+def make_esbd_lines(count: int, seed: int) -> List[Dict[str, Any]]:
+    """ESBD listing lines, newest first as the site lists them."""
+    rng = random.Random(seed)
+    today = date.today()
+    lines = []
+    for i in range(count):
+        posted = posted_day(rng, today)
+        lines.append({
+            "solicitationId": f"{rng.randint(100, 999)}-{posted:%y}-{i:06d}",
+            "internalid": 1000000 + i,
+            "title": title(rng),
+            "agencyName": department(rng),
+            "statusName": rng.choice(STATUSES),
+            "postingDate": f"{posted:%m/%d/%Y}",
+        })
+    lines.sort(key=lambda line: datetime.strptime(line["postingDate"], "%m/%d/%Y"), reverse=True)
+    return lines
+
+
+def make_evp_records(count: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed + 1)
+    today = date.today()
+    records = []
+    for i in range(count):
+        posted = posted_day(rng, today)
+        attributes = {
+            "statecode": "Open",
+            "evp_opendate": f"{posted:%m/%d/%Y} {rng.randint(1, 12)}:00 PM",
+            "owningbusinessunit": department(rng),
+            "evp_posteddate": f"{posted:%m/%d/%Y} {rng.randint(1, 12)}:30 AM",
+            "evp_solicitationid": f"{rng.getrandbits(128):032x}",
+            "evp_name": title(rng),
+            "statuscode": rng.choice(STATUSES),
+            "evp_solicitationnbr": f"{rng.randint(10, 99)}-RFP-{i:06d}",
+            "evp_description": description(rng),
+            # The live grid carries more columns than the scraper maps
+            "evp_category": rng.choice(["Goods", "Services", "Construction"]),
+            "createdon": f"{posted:%m/%d/%Y} 8:00 AM",
+        }
+        records.append({
+            "Id": f"{rng.getrandbits(128):032x}",
+            "EntityName": "evp_solicitation",
+            "Attributes": [{"Name": name, "Value": value, "DisplayValue": value}
+                           for name, value in attributes.items()],
+        })
+    return records
+
+
+class FakeSources:
+    """The data and knobs shared by both servers."""
+
+    def __init__(self, esbd_records: int, evp_records: int, records_per_page: int,
+                 latency: float, error_rate: float, gzip_mode: str, seed: int):
+        self.esbd_lines = make_esbd_lines(esbd_records, seed)
+        self.evp_records = make_evp_records(evp_records, seed)
+        self.records_per_page = records_per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.gzip_mode = gzip_mode
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + amount
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def esbd_page(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        lines = self.esbd_lines
+        start_date = request.get("startDate")
+        if start_date:
+            since = datetime.strptime(start_date, "%m/%d/%Y")
+            lines = [line for line in lines if datetime.strptime(line["postingDate"], "%m/%d/%Y") >= since]
+        page = max(int(request.get("page", 1)), 1)
+        start = (page - 1) * self.records_per_page
+        return {
+            "lines": lines[start:start + self.records_per_page],
+            "totalRecordsFound": len(lines),
+            "recordsPerPage": self.records_per_page,
+            "page": page,
+        }
+
+    def esbd_details(self, identification: str) -> Dict[str, Any]:
+        # The same description for the same solicitation every time
+        rng = random.Random(f"{self.seed}:{identification}")
+        return {"identification": identification, "description": description(rng)}
+
+    def evp_grid(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        page_size = int(request.get("pageSize", 10))
+        page = max(int(request.get("pageNumber", 1)), 1)
+        records = self.evp_records[(page - 1) * page_size:page * page_size]
+        return {"Records": records, "ItemCount": len(self.evp_records),
+                "MoreRecords": page * page_size < len(self.evp_records)}
+
+
+def make_handler(sources: FakeSources, routes: Dict[Tuple[str, str], str]):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            self.handle_request("GET")
+
+        def do_POST(self) -> None:
+            self.handle_request("POST")
+
+        def handle_request(self, method: str) -> None:
+            url = urlsplit(self.path)
+            body: Dict[str, Any] = {}
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                body = json.loads(self.rfile.read(length) or b"{}")
+
+            if url.path == STATS_PATH:
+                self.send_json(sources.stats, allow_gzip=False)
+                return
+            endpoint = routes.get((method, url.path))
+            if endpoint is None:
+                self.send_error(404)
+                return
+
+            sources.count(endpoint)
+            if sources.latency:
+                # Exponential, so the occasional request is much slower, as on the live sites
+                time.sleep(random.expovariate(1 / sources.latency))
+            if sources.should_fail():
+                sources.count("errors")
+                self.send_response(503)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            if endpoint == "esbd_page":
+                self.send_json(sources.esbd_page(body))
+            elif endpoint == "esbd_details":
+                query = parse_qs(url.query)
+                self.send_json(sources.esbd_details(query.get("identification", [""])[0]))
+            else:
+                self.send_json(sources.evp_grid(body))
+
+        def send_json(self, payload: Any, allow_gzip: bool = True) -> None:
+            data = json.dumps(payload).encode()
+            accepts_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+            compress = allow_gzip and (sources.gzip_mode == "always"
+                                       or (sources.gzip_mode == "auto" and accepts_gzip))
+            if compress:
+                data = gzip.compress(data, compresslevel=6)
+            sources.count("bytes_sent", len(data))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if compress:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def serve(sources: FakeSources, esbd_port: int = 0, evp_port: int = 0,
+          host: str = "127.0.0.1") -> Tuple[ThreadingHTTPServer, ThreadingHTTPServer]:
+    """
+    Start both servers on background threads.
+    :return: The ESBD and EVP servers; server_address gives the port each is on
+    """
+    esbd = ThreadingHTTPServer((host, esbd_port), make_handler(sources, {
+        ("POST", ESBD_PATH): "esbd_page",
+        ("GET", DETAILS_PATH): "esbd_details",
+    }))
+    evp = ThreadingHTTPServer((host, evp_port), make_handler(sources, {
+        ("POST", GRID_PATH): "evp_grid",
+    }))
+    for server in (esbd, evp):
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return esbd, evp
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--esbd-records", type=int, default=5000)
+    parser.add_argument("--evp-records", type=int, default=800)
+    parser.add_argument("--records-per-page", type=int, default=24, help="ESBD listing page size, 24 on the live site")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean seconds added to each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    parser.add_argument("--gzip", dest="gzip_mode", choices=["auto", "always", "never"], default="auto",
+                        help="auto compresses when the client sends Accept-Encoding: gzip")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def sources_from_args(args: argparse.Namespace) -> FakeSources:
+    return FakeSources(args.esbd_records, args.evp_records, args.records_per_page,
+                       args.latency, args.error_rate, args.gzip_mode, args.seed)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--esbd-port", type=int, default=8701)
+    parser.add_argument("--evp-port", type=int, default=8702)
+    args = parser.parse_args(argv)
+    esbd, evp = serve(sources_from_args(args), args.esbd_port, args.evp_port)
+    print(f"ESBD_BASE_URL = \"{base_url(esbd)}\"")
+    print(f"EVP_BASE_URL = \"{base_url(evp)}\"")
+    print("EVP_USE_BROWSER = False", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+End-to-end refresh benchmark against local stand-in servers.
+
+Starts bench/fake_sources.py in a subprocess (so it doesn't share the GIL with
+the scrapers), points the ESBD and EVP scrapers at it, runs a full refresh of
+each into a throwaway database and reports wall time, requests per second and
+peak memory. Takes the same load options as bench/fake_sources.py.
+
+    python -m bench.refresh_e2e [--esbd-records 5000] [--latency 0.05]
+                                [--error-rate 0.01] [--gzip never] [--output e2e.json]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import requests
+
+import config
+from bench.fake_sources import add_arguments
+
+
+def start_fake_sources(args: argparse.Namespace) -> subprocess.Popen:
+    """Run the stand-in servers on free ports and point the scrapers' config at them."""
+    command = [sys.executable, "-m", "bench.fake_sources", "--esbd-port", "0", "--evp-port", "0",
+               "--esbd-records", str(args.esbd_records), "--evp-records", str(args.evp_records),
+               "--records-per-page", str(args.records_per_page), "--latency", str(args.latency),
+               "--error-rate", str(args.error_rate), "--gzip", args.gzip_mode, "--seed", str(args.seed)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    assert server.stdout is not None
+    # Once listening it prints the env.py lines to use, base URLs first
+    for _ in range(2):
+        name, _, value = server.stdout.readline().partition(" = ")
+        setattr(config, name.strip(), value.strip().strip('"'))
+    config.EVP_USE_BROWSER = False
+    return server
+
+
+def fetch_stats(base_url: str) -> Dict[str, int]:
+    return requests.get(f"{base_url}/_stats", timeout=10).json()
+
+
+def run_source(name: str, refresh: Callable[[], bool], base_url: str) -> Dict[str, Any]:
+    before = fetch_stats(base_url)
+    started = time.perf_counter()
+    ok = refresh()
+    elapsed = time.perf_counter() - started
+    after = fetch_stats(base_url)
+    served = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+    requests_made = sum(count for key, count in served.items() if key not in ("errors", "bytes_sent"))
+    result = {
+        "ok": ok,
+        "seconds": elapsed,
+        "requests": requests_made,
+        "requests_per_second": requests_made / elapsed if elapsed else 0.0,
+        "errors_injected": served.get("errors", 0),
+        "megabytes_received": served.get("bytes_sent", 0) / 1e6,
+        "by_endpoint": {key: count for key, count in served.items() if key not in ("errors", "bytes_sent")},
+    }
+    print(f"{name:<6} {'ok' if ok else 'FAILED':<7} {elapsed:>7.2f}s  {requests_made:>6} requests  "
+          f"{result['requests_per_second']:>7.1f} req/s  {result['errors_injected']} errors injected  "
+          f"{result['megabytes_received']:.1f}MB")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--sources", default="esbd,evp", help="Comma separated: esbd, evp")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Also report peak Python heap, which slows the run down")
+    parser.add_argument("--output", help="Write the results here as JSON")
+    args = parser.parse_args()
+
+    server = start_fake_sources(args)
+    workdir = tempfile.mkdtemp(prefix="solicitations-e2e-")
+    try:
+        # Import the scrapers only now, so they pick up the stand-in URLs
+        import metrics
+        from storage import db
+        from data_sources.http_cache import http
+        from data_sources.evp_nc_gov import save_evp_solicitations_to_db
+        from data_sources.txsmartbuy_gov__esbd import save_txsmartbuy_solicitations_to_db
+
+        db.DB_PATH = os.path.join(workdir, "e2e.db")
+        db.setup_db()
+        db.setup_solicitations_table()
+        # Measure the network path, not the on-disk response cache
+        http.set_mode("off")
+
+        refreshes: Dict[str, Callable[[], bool]] = {
+            "esbd": lambda: save_txsmartbuy_solicitations_to_db(full=True),
+            "evp": save_evp_solicitations_to_db,
+        }
+        base_urls = {"esbd": config.ESBD_BASE_URL, "evp": config.EVP_BASE_URL}
+        chosen: List[str] = [name for name in args.sources.split(",") if name]
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        results: Dict[str, Any] = {}
+        started = time.perf_counter()
+        for name in chosen:
+            results[name] = run_source(name, refreshes[name], base_urls[name])
+        wall = time.perf_counter() - started
+
+        summary: Dict[str, Any] = {
+            "wall_seconds": wall,
+            "solicitations_stored": len(db.get_all_solicitations()),
+            # ru_maxrss is KB on Linux, bytes on macOS
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3),
+        }
+        if args.tracemalloc:
+            summary["peak_python_heap_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+        print(f"\nRefreshed {summary['solicitations_stored']} solicitations in {wall:.2f}s, "
+              f"peak RSS {summary['peak_rss_mb']:.0f}MB"
+              + (f", peak Python heap {summary['peak_python_heap_mb']:.0f}MB" if args.tracemalloc else ""))
+        metrics.flush()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "summary": summary, "sources": results}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Render 500 digests of 1,000 solicitations each, with and without the digest caches.
+
+Users are spread over a smaller number of distinct match sets drawn from one
+corpus, the way many users share filters in practice.
+
+    python -m bench.render_digests [--digests 500] [--items 1000] [--match-sets 50]
+"""
+import argparse
+import random
+import time
+
+from data_sources.Solicitation import Solicitation, Solicitations
+from digest import cache_stats, clear_caches, render_digest
+from timing import summarize
+
+
+def make_corpus(size: int) -> Solicitations:
+    return Solicitations(
+        Solicitation(
+            Id=str(i),
+            EntityName="BENCH",
+            title=f"Solicitation {i}",
+            description="Lorem ipsum dolor sit amet. " * 20,
+            posted_date="01/01/2026",
+            open_date="01/15/2026 2:00 PM",
+            department=f"Department {i % 40}",
+            url=f"https://example.com/solicitations/{i}",
+        )
+        for i in range(size)
+    )
+
+
+def run(digests: int, items: int, match_sets: int, cached: bool) -> None:
+    rng = random.Random(0)
+    corpus = make_corpus(items * 5)
+    sets = [Solicitations(rng.sample(corpus, items)) for _ in range(match_sets)]
+    users = [sets[rng.randrange(match_sets)] for _ in range(digests)]
+
+    clear_caches()
+    latencies = []
+    total_bytes = 0
+    start = time.perf_counter()
+    for matches in users:
+        if not cached:
+            clear_caches()
+        digest_start = time.perf_counter()
+        total_bytes += len(render_digest(matches).encode())
+        latencies.append(time.perf_counter() - digest_start)
+    elapsed = time.perf_counter() - start
+
+    stats = summarize(latencies)
+    print(
+        f"{'cached' if cached else 'uncached':>8}: {elapsed:.2f}s total, "
+        f"p50 {stats['p50'] * 1000:.1f}ms, p95 {stats['p95'] * 1000:.1f}ms, "
+        f"{total_bytes / 1e6:.0f}MB rendered, {cache_stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--digests", type=int, default=500)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--match-sets", type=int, default=50)
+    args = parser.parse_args()
+    for cached in (False, True):
+        run(args.digests, args.items, args.match_sets, cached)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure how long a fresh process takes to import main and to boot a web worker.
+
+Each run is a new interpreter, as a gunicorn worker or one-off script is.
+"import" times `import main`; "boot" adds create_app(start_workers=False)
+against a throwaway database and a first request. Runs under -X importtime,
+which adds a little to both. Also lists the packages that take longest to import and whether the
+browser automation packages were loaded.
+
+    python -m bench.startup [--runs 10] [--python .venv/bin/python] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only loaded for a browser-driven EVP refresh
+BROWSER_MODULES = ["seleniumbase", "seleniumwire", "selenium"]
+
+BOOT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from storage import db
+db.DB_PATH = sys.argv[1]
+main.create_app(start_workers=False).test_client().get("/healthcheck")
+booted = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "boot_seconds": booted - started,
+    "modules": len(sys.modules),
+    "browser_modules": [name for name in sys.argv[2:] if name in sys.modules],
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """
+    :return: Seconds to import each package, wherever in the graph it was first imported
+    """
+    packages: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        seconds = int(cumulative) / 1e6
+        package = name.strip().split(".")[0]
+        if package != "main":
+            packages[package] = max(packages.get(package, 0.0), seconds)
+    return packages
+
+
+def run_once(python: str, db_path: str) -> Dict[str, Any]:
+    command = [python, "-X", "importtime", "-c", BOOT_SCRIPT, db_path, *BROWSER_MODULES]
+    started = time.perf_counter()
+    finished = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if finished.returncode:
+        raise SystemExit(f"Boot failed:\n{finished.stderr[-2000:]}")
+    result = json.loads(finished.stdout.strip().splitlines()[-1])
+    return {**result, "process_seconds": wall, "packages": parse_importtime(finished.stderr)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to measure, e.g. a deployment venv's")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to list")
+    parser.add_argument("--output", help="Write the results here as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="solicitations-startup-")
+    try:
+        runs: List[Dict[str, Any]] = [run_once(args.python, os.path.join(workdir, "startup.db"))
+                                      for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {key: statistics.median(run[key] for run in runs)
+               for key in ("import_seconds", "boot_seconds", "process_seconds", "modules")}
+    packages = {name: statistics.median(run["packages"].get(name, 0.0) for run in runs)
+                for name in runs[0]["packages"]}
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    browser_modules = runs[0]["browser_modules"]
+
+    print(f"import main   {summary['import_seconds'] * 1000:>8.1f}ms")
+    print(f"worker boot   {summary['boot_seconds'] * 1000:>8.1f}ms")
+    print(f"process       {summary['process_seconds'] * 1000:>8.1f}ms  (interpreter start to exit)")
+    print(f"modules       {summary['modules']:>8.0f}")
+    print(f"browser       {', '.join(browser_modules) if browser_modules else 'not loaded'}")
+    print(f"\nSlowest packages to import (median of {args.runs} runs):")
+    for name, seconds in slowest:
+        print(f"  {name:<40} {seconds * 1000:>8.1f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": args.python, "runs": args.runs, "summary": summary,
+                       "browser_modules": browser_modules, "slowest_imports": dict(slowest)}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
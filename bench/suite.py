@@ -0,0 +1,170 @@
+"""
+Benchmark filtering, storage and rendering over synthetic corpora.
+
+Runs evaluate_filter, Solicitations.filter, save_solicitations,
+get_all_solicitations and Solicitations.to_html at each corpus size (and
+filter count, for filtering), against a throwaway database. Results are
+written as JSON; pass an earlier results file as --baseline to flag anything
+that got slower by more than --threshold. Exits 1 if anything regressed.
+
+    python -m bench.suite [--sizes 1000,10000,100000] [--filters 10,100,1000]
+                          [--output bench-results.json] [--baseline old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from storage import db
+from data_sources.Solicitation import Solicitations
+from digest import clear_caches
+from filters import evaluate_filter
+from bench.corpus import make_corpus, make_criteria, make_filters
+
+
+# Criteria trees timed individually by the evaluate_filter benchmark
+EVALUATE_CRITERIA = 10
+
+
+def parse_counts(text: str) -> List[int]:
+    return [int(part) for part in text.split(",") if part]
+
+
+def measure(func: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    """Time func repeat times, running setup untimed before each run."""
+    runs: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(runs), "min": min(runs), "runs": runs}
+
+
+class Suite:
+    def __init__(self, repeat: int, max_evaluations: int):
+        self.repeat = repeat
+        self.max_evaluations = max_evaluations
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, name: str, params: Dict[str, int], result: Dict[str, Any]) -> None:
+        key = name + "[" + ",".join(f"{k}={v}" for k, v in params.items()) + "]"
+        self.results[key] = {"name": name, "params": params, **result}
+        if result.get("skipped"):
+            print(f"{key:<50} skipped: {result['skipped']}")
+            return
+        per_record = result["seconds"] / params["records"] * 1e6
+        print(f"{key:<50} {result['seconds'] * 1000:>10.1f}ms  {per_record:>8.2f}us/record")
+
+    def evaluate_filter(self, corpus: Solicitations, criteria: List[Dict[str, Any]]) -> None:
+        """Parsed criteria trees against every record, as the preview and API paths run them."""
+        def run() -> None:
+            for c in criteria:
+                for solicitation in corpus:
+                    evaluate_filter(c, solicitation)
+        self.record("evaluate_filter", {"records": len(corpus), "criteria": len(criteria)},
+                    measure(run, self.repeat))
+
+    def filter(self, corpus: Solicitations, filter_count: int) -> None:
+        """A user's saved filters (JSON strings, parsed per record) over the whole corpus."""
+        params = {"records": len(corpus), "filters": filter_count}
+        if len(corpus) * filter_count > self.max_evaluations:
+            self.record("filter", params, {"skipped": f"over --max-evaluations {self.max_evaluations}"})
+            return
+        user_filters = make_filters(filter_count)
+        self.record("filter", params, measure(lambda: corpus.filter(user_filters), self.repeat))
+
+    def storage(self, corpus: Solicitations) -> None:
+        params = {"records": len(corpus)}
+        self.record("save_solicitations.insert", params,
+                    measure(lambda: db.save_solicitations(corpus), self.repeat, setup=db.clear_all_solicitations))
+        # Saving the same rows again only compares them, as a routine refresh mostly does
+        self.record("save_solicitations.unchanged", params, measure(lambda: db.save_solicitations(corpus), self.repeat))
+        self.record("get_all_solicitations", params, measure(db.get_all_solicitations, self.repeat))
+
+    def render(self, corpus: Solicitations) -> None:
+        params = {"records": len(corpus)}
+        self.record("to_html.cold", params, measure(corpus.to_html, self.repeat, setup=clear_caches))
+        # Another user with the same matches gets the cached body
+        self.record("to_html.warm", params, measure(corpus.to_html, self.repeat))
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    """Print each benchmark's change against the baseline and return those slower by more than threshold."""
+    regressions: List[str] = []
+    print(f"\n{'benchmark':<50} {'baseline':>10} {'now':>10} {'change':>8}")
+    for key, result in results.items():
+        old = baseline.get(key)
+        if result.get("skipped") or not old or old.get("skipped"):
+            continue
+        change = result["seconds"] / old["seconds"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:<50} {old['seconds'] * 1000:>8.1f}ms {result['seconds'] * 1000:>8.1f}ms {change:>+8.0%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_counts, default=[1000, 10000, 100000])
+    parser.add_argument("--filters", type=parse_counts, default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-evaluations", type=int, default=10_000_000,
+                        help="Skip filter runs over records x filters above this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown flagged as a regression, e.g. 0.2 for 20%%")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="solicitations-bench-")
+    db.DB_PATH = os.path.join(workdir, "bench.db")
+    db.setup_db()
+    db.setup_solicitations_table()
+    suite = Suite(args.repeat, args.max_evaluations)
+    criteria = make_criteria(EVALUATE_CRITERIA, args.seed)
+    try:
+        for size in args.sizes:
+            corpus = make_corpus(size, args.seed)
+            suite.evaluate_filter(corpus, criteria)
+            for filter_count in args.filters:
+                suite.filter(corpus, filter_count)
+            suite.storage(corpus)
+            suite.render(corpus)
+    finally:
+        # Instrumented code records metrics; write them while the database still exists
+        metrics.flush()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {"sizes": args.sizes, "filters": args.filters, "repeat": args.repeat, "seed": args.seed},
+            "results": suite.results,
+        }, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(suite.results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Tunable settings and their defaults.
+
+env.py only has to hold the secrets and site settings in example.env.py; any
+name below can also be set there to override the default.
+"""
+import env
+
+# Email sending
+SMTP_TIMEOUT_SECONDS = getattr(env, "SMTP_TIMEOUT_SECONDS", 30)
+SMTP_POOL_SIZE = getattr(env, "SMTP_POOL_SIZE", 4)  # Logged-in sessions kept open for sending
+SMTP_MAX_MESSAGES_PER_CONNECTION = getattr(env, "SMTP_MAX_MESSAGES_PER_CONNECTION", 100)  # Reconnect after this many messages on one session
+SMTP_IDLE_SECONDS = getattr(env, "SMTP_IDLE_SECONDS", 60)  # Reconnect rather than reuse a session idle this long
+OUTBOX_WORKERS = getattr(env, "OUTBOX_WORKERS", 2)  # Threads sending queued mail; the first only sends login links
+OUTBOX_BATCH_SIZE = getattr(env, "OUTBOX_BATCH_SIZE", 20)  # Messages a sender claims at once
+OUTBOX_POLL_SECONDS = getattr(env, "OUTBOX_POLL_SECONDS", 5)  # Idle senders check for mail queued by other processes this often
+OUTBOX_LEASE_SECONDS = getattr(env, "OUTBOX_LEASE_SECONDS", 600)  # Claimed messages not sent within this are sent again
+OUTBOX_MAX_ATTEMPTS = getattr(env, "OUTBOX_MAX_ATTEMPTS", 5)  # Tries before a message is marked failed
+OUTBOX_RETRY_SECONDS = getattr(env, "OUTBOX_RETRY_SECONDS", 30)  # First retry delay, doubled after each failure
+OUTBOX_RETENTION_DAYS = getattr(env, "OUTBOX_RETENTION_DAYS", 7)  # Sent and failed messages are deleted after this long
+
+# Solicitation refresh
+REFRESH_TTL_SECONDS = getattr(env, "REFRESH_TTL_SECONDS", 900)  # Data younger than this is used without refetching
+REFRESH_LOCK_TTL_SECONDS = getattr(env, "REFRESH_LOCK_TTL_SECONDS", 1800)  # A refresh lock is abandoned if not renewed within this
+REFRESH_INTERVALS = getattr(env, "REFRESH_INTERVALS", {  # Background refresh cadence per source, in seconds
+    "EVP_NC_GOV": 3600,
+    "TXSMARTBUY_ESBD": 1800,
+})
+REFRESH_RETRY_SECONDS = getattr(env, "REFRESH_RETRY_SECONDS", 300)  # Retry a failed background refresh after this long
+
+# Scheduler
+SCHEDULER_MAX_SLEEP_SECONDS = getattr(env, "SCHEDULER_MAX_SLEEP_SECONDS", 300)  # Reload schedules at least this often to see other workers' edits
+LEADER_LEASE_SECONDS = getattr(env, "LEADER_LEASE_SECONDS", 60)  # Only one process schedules and refreshes; another takes over if it stops renewing
+
+# Background jobs, shared by every process through the database
+JOB_WORKERS = getattr(env, "JOB_WORKERS", 4)  # Jobs (e.g. scheduled digests) run at once by each process
+JOB_TIMEOUT_SECONDS = getattr(env, "JOB_TIMEOUT_SECONDS", 300)  # A job taking longer than this is failed and reported to the admin
+JOB_LEASE_SECONDS = getattr(env, "JOB_LEASE_SECONDS", 60)  # A job whose worker stops renewing its lease for this long is run again
+JOB_POLL_SECONDS = getattr(env, "JOB_POLL_SECONDS", 5)  # Idle workers check the queue this often
+JOB_MAX_ATTEMPTS = getattr(env, "JOB_MAX_ATTEMPTS", 3)  # Tries before a failed job is given up on
+JOB_RETRY_SECONDS = getattr(env, "JOB_RETRY_SECONDS", 60)  # Wait before retrying a failed job, multiplied by the attempt number
+JOB_RETENTION_DAYS = getattr(env, "JOB_RETENTION_DAYS", 7)  # Finished and failed jobs are deleted after this long
+
+# Texas SmartBuy ESBD refresh
+ESBD_LOOKBACK_DAYS = getattr(env, "ESBD_LOOKBACK_DAYS", 30)  # Window requested on a full reconciliation
+ESBD_OVERLAP_DAYS = getattr(env, "ESBD_OVERLAP_DAYS", 2)  # Re-request this many days before the last successful fetch
+ESBD_FULL_RECONCILE_HOURS = getattr(env, "ESBD_FULL_RECONCILE_HOURS", 24)  # Re-fetch the full window to catch status changes and withdrawals
+ESBD_PAGE_WORKERS = getattr(env, "ESBD_PAGE_WORKERS", 8)  # Most concurrent results page requests (the adaptive limit below decides)
+ESBD_DETAIL_WORKERS = getattr(env, "ESBD_DETAIL_WORKERS", 16)  # Most concurrent description requests (the adaptive limit below decides)
+ESBD_RETRY_ATTEMPTS = getattr(env, "ESBD_RETRY_ATTEMPTS", 3)  # Retries for throttled pages and descriptions at the end of a run
+
+# Scraper endpoints. Point these at bench/fake_sources.py to benchmark refreshes locally.
+ESBD_BASE_URL = getattr(env, "ESBD_BASE_URL", "https://www.txsmartbuy.gov")
+EVP_BASE_URL = getattr(env, "EVP_BASE_URL", "https://evp.nc.gov")
+EVP_USE_BROWSER = getattr(env, "EVP_USE_BROWSER", True)  # False posts the EVP grid request directly, without Selenium; only works against a stand-in server
+
+# Scraper HTTP cache
+# "revalidate" caches responses and revalidates them with ETag/Last-Modified,
+# "record" saves every scraper response to HTTP_RECORDING_DIR, "replay" serves
+# a recording offline, "off" disables caching
+HTTP_CACHE_MODE = getattr(env, "HTTP_CACHE_MODE", "revalidate")
+HTTP_CACHE_DIR = getattr(env, "HTTP_CACHE_DIR", "http_cache")
+HTTP_RECORDING_DIR = getattr(env, "HTTP_RECORDING_DIR", "http_recording")
+
+# Scraper request limits, per host
+HTTP_TIMEOUT_SECONDS = getattr(env, "HTTP_TIMEOUT_SECONDS", 30)
+HTTP_INITIAL_CONCURRENCY = getattr(env, "HTTP_INITIAL_CONCURRENCY", 4)  # Grows while responses stay fast, halves on 429/5xx/timeouts
+HTTP_MAX_CONCURRENCY = getattr(env, "HTTP_MAX_CONCURRENCY", 16)
+CIRCUIT_FAILURE_THRESHOLD = getattr(env, "CIRCUIT_FAILURE_THRESHOLD", 10)  # Consecutive failures before a host is left alone
+CIRCUIT_RESET_SECONDS = getattr(env, "CIRCUIT_RESET_SECONDS", 60)  # How long to leave it before trying again
+
+# Selenium browser pool
+BROWSER_POOL_SIZE = getattr(env, "BROWSER_POOL_SIZE", 1)  # Warm Chrome instances kept between refreshes
+BROWSER_MAX_USES = getattr(env, "BROWSER_MAX_USES", 20)  # Restart a browser after this many refreshes
+BROWSER_MAX_MEMORY_MB = getattr(env, "BROWSER_MAX_MEMORY_MB", 512)  # Restart a browser whose page heap grows past this
+
+# Ingestion
+INGEST_BATCH_SIZE = getattr(env, "INGEST_BATCH_SIZE", 200)  # Solicitations committed per database write
+INGEST_MAX_PENDING_BATCHES = getattr(env, "INGEST_MAX_PENDING_BATCHES", 2)  # Fetching pauses while this many batches wait on the database
+
+# Digest rendering
+DIGEST_FRAGMENT_CACHE_SIZE = getattr(env, "DIGEST_FRAGMENT_CACHE_SIZE", 5000)  # Rendered solicitation entries kept for reuse across digests
+DIGEST_BODY_CACHE_SIZE = getattr(env, "DIGEST_BODY_CACHE_SIZE", 50)  # Whole digest bodies kept for users with identical matches
+DIGEST_MAX_ITEMS = getattr(env, "DIGEST_MAX_ITEMS", 100)  # Longer digests list this many summaries and link to the rest
+DIGEST_MAX_BYTES = getattr(env, "DIGEST_MAX_BYTES", 200000)  # Longer digests are cut to summaries that fit in this many bytes
+DIGEST_PAGE_SIZE = getattr(env, "DIGEST_PAGE_SIZE", 50)  # Solicitations per page when viewing a full digest on the site
+DIGEST_RETENTION_DAYS = getattr(env, "DIGEST_RETENTION_DAYS", 30)  # How long the full list behind a digest link stays viewable
+
+# JSON API
+API_PAGE_SIZE = getattr(env, "API_PAGE_SIZE", 100)  # Items per page unless ?limit= asks for fewer or more
+API_MAX_PAGE_SIZE = getattr(env, "API_MAX_PAGE_SIZE", 500)
+API_GZIP_MIN_BYTES = getattr(env, "API_GZIP_MIN_BYTES", 1024)  # Smaller responses aren't worth compressing
+
+# Filter editor preview
+PREVIEW_PAGE_SIZE = getattr(env, "PREVIEW_PAGE_SIZE", 20)  # Matches shown per preview page
+PREVIEW_CACHE_SIZE = getattr(env, "PREVIEW_CACHE_SIZE", 200)  # Criteria whose matches are kept until the data changes
+
+# Login sessions
+USER_CACHE_SIZE = getattr(env, "USER_CACHE_SIZE", 1000)  # Users kept in memory per process between requests
+USER_CACHE_TTL_SECONDS = getattr(env, "USER_CACHE_TTL_SECONDS", 30)  # How stale a cached user can be in other processes after a change
+
+# Metrics
+METRICS_FLUSH_SECONDS = getattr(env, "METRICS_FLUSH_SECONDS", 10)  # How often each process adds its samples to the shared totals /metrics reports
+METRICS_TOKEN = getattr(env, "METRICS_TOKEN", "")  # If set, /metrics requires "Authorization: Bearer <token>"
+
+# Logging
+LOG_LEVEL = getattr(env, "LOG_LEVEL", "INFO")  # DEBUG adds per-page and per-batch detail
+LOG_FORMAT = getattr(env, "LOG_FORMAT", "text")  # "json" writes one JSON object per line
+LOG_SAMPLE_EVERY = getattr(env, "LOG_SAMPLE_EVERY", 100)  # Per-record events are logged on the first and every Nth occurrence
+LOG_QUEUE_SIZE = getattr(env, "LOG_QUEUE_SIZE", 10000)  # Records waiting to be written; more are dropped rather than block the app
@@ -53,36 +53,15 @@ class Solicitation:
             f"description={self.description})"
 
     def format_html(self) -> str:
-        # Use the solicitation's URL if available, otherwise fall back to EVP format
-        if self.url:
-            job_link = self.url
-        else:
-            job_link = f"https://evp.nc.gov/solicitations/details/?id={self.Id}"
-
-        lines = [
-            f'<li><strong>{FIELD_LABELS.get("title", "Name")}:</strong> <a href="{job_link}">{self.title}</a><br>']
-        for field, label in FIELD_LABELS.items():
-            if field == "title":
-                continue
-            value = getattr(self, field, "")
-            if value:
-                lines.append(f"<strong>{label}:</strong> {value}<br>")
-        lines.append("</li>")
-        return "\n".join(lines)
+        from digest import render_solicitation
+        return render_solicitation(self)
 
 
 class Solicitations(List[Solicitation]):
 
     def to_html(self) -> str:
-        if not self:
-            return "No solicitations found."
-
-        body_lines: List[str] = []
-        body_lines.append("<h2>Solicitations Summary:</h2><ul>")
-        for s in self:
-            body_lines.append(s.format_html())
-        body_lines.append("</ul>")
-        return "\n".join(body_lines)
+        from digest import render_digest
+        return render_digest(self)
 
     def filter(self, filters: List[Filter]) -> "Solicitations":
         from filters import evaluate_filter
@@ -0,0 +1,134 @@
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+from seleniumbase import Driver
+
+from log import get_logger
+from config import BROWSER_POOL_SIZE, BROWSER_MAX_USES, BROWSER_MAX_MEMORY_MB
+
+log = get_logger(__name__)
+
+
+@dataclass
+class PooledDriver:
+    driver: Any
+    uses: int = 0
+
+
+def create_driver() -> Any:
+    """Start a headless Chrome with selenium-wire so sources can inspect its requests."""
+    log.info("Starting Selenium driver")
+    return Driver(
+        headless=True,
+        agent="user",
+        browser="chrome",
+        use_wire=True,
+        remote_debug=True
+    )
+
+
+def quit_driver(entry: PooledDriver) -> None:
+    try:
+        entry.driver.quit()
+    except Exception as e:
+        log.warning("Error quitting Selenium driver", error=e)
+
+
+def is_healthy(entry: PooledDriver) -> bool:
+    """Check the browser still answers before handing it out."""
+    try:
+        entry.driver.execute_script("return 1")
+        return True
+    except Exception as e:
+        log.warning("Selenium driver failed health check", error=e)
+        return False
+
+
+def memory_mb(entry: PooledDriver) -> Optional[float]:
+    """JS heap used by the current page, in MB, or None if Chrome won't say."""
+    try:
+        used = entry.driver.execute_script(
+            "return window.performance.memory ? window.performance.memory.usedJSHeapSize : null")
+    except Exception:
+        return None
+    return used / (1024 * 1024) if used else None
+
+
+class BrowserPool:
+    """
+    Keep warm Selenium drivers alive between refreshes.
+
+    Drivers are leased with `with pool.lease() as driver:`. A driver is recycled
+    after BROWSER_MAX_USES leases, when its page memory passes
+    BROWSER_MAX_MEMORY_MB, when it fails a health check, or when the lease raised.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE,
+                 max_uses: int = BROWSER_MAX_USES,
+                 max_memory_mb: float = BROWSER_MAX_MEMORY_MB):
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self._idle: "queue.LifoQueue[PooledDriver]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _checkout(self) -> PooledDriver:
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                return PooledDriver(create_driver())
+            if is_healthy(entry):
+                return entry
+            quit_driver(entry)
+
+    def _should_recycle(self, entry: PooledDriver) -> bool:
+        if entry.uses >= self.max_uses:
+            log.info("Recycling Selenium driver", uses=entry.uses)
+            return True
+        used = memory_mb(entry)
+        if used is not None and used > self.max_memory_mb:
+            log.info("Recycling Selenium driver", memory_mb=round(used))
+            return True
+        return False
+
+    def _checkin(self, entry: PooledDriver) -> None:
+        entry.uses += 1
+        if self._should_recycle(entry):
+            quit_driver(entry)
+            return
+        try:
+            # Drop selenium-wire's captured requests and unload the page
+            del entry.driver.requests
+            entry.driver.get("about:blank")
+        except Exception as e:
+            log.warning("Error resetting Selenium driver", error=e)
+            quit_driver(entry)
+            return
+        self._idle.put(entry)
+
+    @contextmanager
+    def lease(self) -> Iterator[Any]:
+        """Borrow a driver, blocking while every driver is in use."""
+        with self._slots:
+            entry = self._checkout()
+            try:
+                yield entry.driver
+            except BaseException:
+                quit_driver(entry)
+                raise
+            self._checkin(entry)
+
+    def shutdown(self) -> None:
+        while True:
+            try:
+                quit_driver(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
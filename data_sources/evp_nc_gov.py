@@ -2,11 +2,24 @@ import gzip
 import requests
 from io import BytesIO
 import json
-from seleniumbase import Driver
-# from selenium.webdriver.chrome.options import Options
+from typing import Any, Dict, Iterator, Optional
 
 from data_sources.Solicitation import Solicitation, Solicitations
-from storage.db import save_solicitations, clear_solicitations_by_source
+from data_sources.http_cache import CachedSession, http
+from data_sources.pipeline import ingest, normalize
+from storage.db import delete_solicitations_not_in
+from log import get_logger, traced
+from config import EVP_BASE_URL, EVP_USE_BROWSER
+
+log = get_logger(__name__)
+
+SOURCE_NAME = "EVP_NC_GOV"
+SOLICITATIONS_PAGE_URL = f"{EVP_BASE_URL}/solicitations/"
+GRID_DATA_URL = f"{EVP_BASE_URL}/_services/entity-grid-data.json/"
+# Records asked for in the one grid request, enough for every open solicitation
+GRID_PAGE_SIZE = 1000
+# The grid request body carries per-session tokens, so record it under a fixed key
+GRID_CACHE_KEY = "evp-entity-grid-data"
 
 
 def evp_from_dict(record: dict) -> Solicitation:
@@ -49,101 +62,114 @@ def evp_from_dict(record: dict) -> Solicitation:
     )
 
 
-def save_evp_solicitations_to_db() -> None:
+def save_evp_solicitations_to_db() -> bool:
     """
     Fetch EVP solicitations and save them to the database.
+    :return: Whether the refresh succeeded
     """
-    print("Fetching and saving EVP solicitations...")
-
-    # Clear old EVP solicitations
-    clear_solicitations_by_source("EVP_NC_GOV")
-
-    # Fetch new solicitations
-    solicitations = fetch_solicitation_data()
-
-    # Save to database
-    if solicitations:
-        save_solicitations(solicitations)
-        print(f"Saved {len(solicitations)} EVP solicitations to database")
-    else:
-        print("No EVP solicitations to save")
-
-
-def fetch_solicitation_data() -> Solicitations:
-    """Fetch raw solicitation data from EVP NC Gov using Selenium and return as Solicitations."""
-    # options = Options()
-    # options.add_argument("--headless=new")
-
-    print("Starting Selenium driver...")
-    driver = Driver(
-        headless=True,
-        agent="user",
-        browser="chrome",
-        use_wire=True,
-        remote_debug=True
-    )
-
-    print("Navigating to the solicitations page...")
-    driver.get("https://evp.nc.gov/solicitations/")
+    log.info("Fetching and saving EVP solicitations")
+
+    # Stream into the database in batches; completed batches survive a crash
+    try:
+        writer = ingest(iter_evp_solicitations())
+    except Exception:
+        log.exception("Error fetching EVP data")
+        return False
+
+    if not writer.saved_count:
+        log.warning("No EVP solicitations to save")
+        return False
+
+    # Drop old EVP solicitations only once the new set is safely stored
+    delete_solicitations_not_in(SOURCE_NAME, writer.saved_ids)
+    log.info("Saved EVP solicitations", count=writer.saved_count)
+    return True
+
+
+@traced("evp_grid")
+def fetch_evp_grid_data() -> Optional[Dict[str, Any]]:
+    """Fetch the raw entity grid JSON from EVP NC Gov using a pooled Selenium driver."""
+    if http.mode == "replay":
+        # Recorded runs don't need a browser to find the grid request
+        return decode_grid_response(http.post(GRID_DATA_URL, cache_key=GRID_CACHE_KEY))
+    if not EVP_USE_BROWSER:
+        # e.g. bench/fake_sources.py, which doesn't check the page's session tokens
+        return decode_grid_response(http.post(
+            GRID_DATA_URL, json={"pageNumber": 1, "pageSize": GRID_PAGE_SIZE}, cache_key=GRID_CACHE_KEY))
+
+    # Only now, as it pulls in seleniumbase and selenium-wire
+    from data_sources.browser_pool import browser_pool
+    with browser_pool.lease() as driver:
+        return find_grid_data(driver)
+
+
+def find_grid_data(driver: Any) -> Optional[Dict[str, Any]]:
+    """Replay the grid request the solicitations page makes, asking for every record at once."""
+    log.info("Navigating to the solicitations page")
+    driver.get(SOLICITATIONS_PAGE_URL)
     driver.implicitly_wait(10)
 
     data = None
-    print("Processing requests...")
     for request in driver.requests:
         if not request.response:
-            print("Invalid response")
+            log.debug("Skipping request without a response", url=request.url)
             continue
         if request.response.status_code != 200:
-            print("Bad status code")
+            log.debug("Skipping failed request", url=request.url, status=request.response.status_code)
             continue
-        if "/_services/entity-grid-data.json/" not in request.url:
-            # print("Skipping request:", request.url)
+        if not request.url.startswith(GRID_DATA_URL):
             continue
 
-        print("Processing request:", request.url)
+        log.info("Replaying grid request", url=request.url)
         updated_payload = json.loads(request.body.decode('utf-8'))
-        updated_payload['pageSize'] = 1000
+        updated_payload['pageSize'] = GRID_PAGE_SIZE
 
         headers = dict(request.headers)
         headers.pop('Content-Length', None)
-        headers['Referer'] = "https://evp.nc.gov/solicitations/"
-        headers['Origin'] = "https://evp.nc.gov"
+        headers['Referer'] = SOLICITATIONS_PAGE_URL
+        headers['Origin'] = EVP_BASE_URL
         headers['Accept-Encoding'] = "gzip"
 
         session = requests.Session()
         for cookie in driver.get_cookies():
             session.cookies.set(cookie['name'], cookie['value'])
 
-        resp = session.post(
+        resp = CachedSession(mode=http.mode, session=session).post(
             request.url,
             headers=headers,
             json=updated_payload,
-            verify=False
+            verify=False,
+            cache_key=GRID_CACHE_KEY
         )
-
-        encoding = resp.headers.get('Content-Encoding', '').lower()
-        if 'gzip' in encoding:
-            try:
-                with gzip.GzipFile(fileobj=BytesIO(resp.content)) as f:
-                    data = json.loads(f.read().decode('utf-8'))
-            except gzip.BadGzipFile:
-                data = resp.json()
-        else:
-            data = resp.json()
+        data = decode_grid_response(resp)
 
         break
 
-    driver.quit()
-
     if not data:
-        print("No data retrieved from EVP")
-        return Solicitations()
+        log.warning("No data retrieved from EVP")
+    return data
 
-    # Convert to Solicitations
-    solicitations = Solicitations(
-        evp_from_dict(record)
-        for record in data.get("Records", [])
-    )
 
-    print(f"Fetched {len(solicitations)} solicitations from EVP")
+def decode_grid_response(resp: requests.Response) -> Any:
+    encoding = resp.headers.get('Content-Encoding', '').lower()
+    if 'gzip' in encoding:
+        try:
+            with gzip.GzipFile(fileobj=BytesIO(resp.content)) as f:
+                return json.loads(f.read().decode('utf-8'))
+        except gzip.BadGzipFile:
+            return resp.json()
+    return resp.json()
+
+
+def iter_evp_solicitations() -> Iterator[Solicitation]:
+    """Stream solicitations from EVP NC Gov."""
+    data = fetch_evp_grid_data()
+    if data:
+        yield from normalize(data.get("Records", []), evp_from_dict)
+
+
+def fetch_solicitation_data() -> Solicitations:
+    """Fetch raw solicitation data from EVP NC Gov using Selenium and return as Solicitations."""
+    solicitations = Solicitations(iter_evp_solicitations())
+    log.info("Fetched EVP solicitations", count=len(solicitations))
     return solicitations
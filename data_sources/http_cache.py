@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from data_sources.throttle import governor_for
+from config import HTTP_CACHE_MODE, HTTP_CACHE_DIR, HTTP_RECORDING_DIR, HTTP_TIMEOUT_SECONDS
+
+# off: plain requests. revalidate: store responses and revalidate them with
+# conditional headers. record: always fetch live and save every response to the
+# recording. replay: serve only from the recording and never touch the network.
+MODES = ("off", "revalidate", "record", "replay")
+
+# Headers that describe the wire format rather than the body we keep
+HOP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def request_key(method: str, url: str, params: Optional[Dict[str, Any]] = None,
+                json_body: Any = None, ignore: Iterable[str] = ()) -> str:
+    """Hash a request into a cache key, leaving out any params or body fields named in ignore."""
+    ignore = set(ignore)
+    def strip(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {k: v for k, v in value.items() if k not in ignore}
+        return value
+    parts = [method.upper(), url, strip(params or {}), strip(json_body)]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class CachedSession:
+    """
+    A requests session with an on-disk response cache underneath.
+
+    Scrapers call get()/post() as they would on requests. Every call accepts
+    cache_key to name a request whose URL or body isn't stable between runs, and
+    replay_ignore to leave volatile fields (such as today's date) out of the key
+    used for recordings.
+    """
+
+    def __init__(self, mode: str = HTTP_CACHE_MODE, cache_dir: str = HTTP_CACHE_DIR,
+                 recording_dir: str = HTTP_RECORDING_DIR,
+                 session: Optional[requests.Session] = None):
+        self.set_mode(mode)
+        self.cache_dir = cache_dir
+        self.recording_dir = recording_dir
+        if session is None:
+            session = requests.Session()
+            # Enough keep-alive connections for the scrapers' worker pools
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            session.mount("https://", adapter)
+            # Plain HTTP is only for local stand-in servers, e.g. bench/fake_sources.py
+            session.mount("http://", adapter)
+        self.session = session
+
+    def set_mode(self, mode: str) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown HTTP cache mode: {mode}")
+        self.mode = mode
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, cache_key: Optional[str] = None,
+                replay_ignore: Iterable[str] = (), **kwargs: Any) -> requests.Response:
+        if self.mode == "off":
+            return self._send(method, url, **kwargs)
+
+        if self.mode in ("record", "replay"):
+            path = self._path(self.recording_dir, cache_key or request_key(
+                method, url, kwargs.get("params"), kwargs.get("json"), replay_ignore))
+            if self.mode == "replay":
+                cached = self._load(path)
+                if cached is None:
+                    raise CacheMiss(f"No recorded response for {method} {url}")
+                return cached
+            response = self._send(method, url, **kwargs)
+            self._store(path, response)
+            return response
+
+        # revalidate
+        path = self._path(self.cache_dir, cache_key or request_key(
+            method, url, kwargs.get("params"), kwargs.get("json")))
+        cached = self._load(path)
+        if cached is not None:
+            headers = dict(kwargs.pop("headers", None) or {})
+            if "ETag" in cached.headers:
+                headers["If-None-Match"] = cached.headers["ETag"]
+            if "Last-Modified" in cached.headers:
+                headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+            kwargs["headers"] = headers
+        response = self._send(method, url, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            return cached
+        if response.ok and ("ETag" in response.headers or "Last-Modified" in response.headers):
+            self._store(path, response)
+        return response
+
+    def _send(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Make the live request under the host's adaptive concurrency limit."""
+        kwargs.setdefault("timeout", HTTP_TIMEOUT_SECONDS)
+        return governor_for(url).call(lambda: self.session.request(method, url, **kwargs),
+                                      endpoint=f"{method.upper()} {urlsplit(url).path}")
+
+    @staticmethod
+    def _path(directory: str, key: str) -> str:
+        return os.path.join(directory, f"{key}.json")
+
+    @staticmethod
+    def _load(path: str) -> Optional[requests.Response]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.url = entry["url"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"].encode("latin-1")
+        response.encoding = entry.get("encoding")
+        return response
+
+    @staticmethod
+    def _store(path: str, response: requests.Response) -> None:
+        entry = {
+            "url": response.url,
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS},
+            "encoding": response.encoding,
+            # latin-1 round-trips arbitrary bytes through JSON
+            "body": response.content.decode("latin-1"),
+            "stored_at": time.time(),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+
+# Shared by the scrapers so they reuse connections and one cache mode
+http = CachedSession()
@@ -0,0 +1,109 @@
+import logging
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Set, TypeVar
+
+from data_sources.Solicitation import Solicitation, Solicitations
+from storage.db import save_solicitations
+from log import get_logger, bind_context
+from config import INGEST_BATCH_SIZE, INGEST_MAX_PENDING_BATCHES
+
+log = get_logger(__name__)
+
+T = TypeVar("T")
+
+# Sentinel telling the writer thread to stop
+_DONE = object()
+
+
+def normalize(records: Iterable[T], normalizer: Callable[[T], Solicitation]) -> Iterator[Solicitation]:
+    """
+    Turn raw source records into Solicitations, skipping records that fail to parse.
+    """
+    for record in records:
+        try:
+            yield normalizer(record)
+        except Exception as e:
+            log.sampled(logging.WARNING, "Skipping record that failed to normalize", error=e)
+
+
+class BatchWriter:
+    """
+    Persist solicitations in batches from a background thread.
+
+    put() hands records to the writer; once INGEST_MAX_PENDING_BATCHES full batches
+    are waiting on the database, put() blocks, so a slow database throttles the
+    fetchers instead of letting pages pile up in memory. Every batch is committed
+    on its own, so a crash mid-run keeps everything written so far.
+    """
+
+    def __init__(self,
+                 batch_size: int = INGEST_BATCH_SIZE,
+                 max_pending_batches: int = INGEST_MAX_PENDING_BATCHES,
+                 save: Callable[[Solicitations], None] = save_solicitations):
+        self.batch_size = batch_size
+        self.saved_count = 0
+        self.saved_ids: Set[str] = set()
+        self._save = save
+        self._batch: List[Solicitation] = []
+        self._queue: "queue.Queue[object]" = queue.Queue(maxsize=max_pending_batches)
+        self._error: Optional[BaseException] = None
+        # Saves run inside the refresh's trace
+        self._thread = threading.Thread(target=bind_context(self._run), daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is _DONE:
+                return
+            # Keep draining after a failure so producers never block forever
+            if self._error is not None or not isinstance(batch, Solicitations):
+                continue
+            try:
+                self._save(batch)
+                self.saved_count += len(batch)
+                self.saved_ids.update(s.solicitation_id or s.Id for s in batch)
+            except Exception as e:
+                self._error = e
+
+    def put(self, solicitation: Solicitation) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"Batch writer failed: {self._error}") from self._error
+        self._batch.append(solicitation)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._batch:
+            self._queue.put(Solicitations(self._batch))
+            self._batch = []
+
+    def close(self) -> None:
+        """Write any buffered records and wait for the writer to finish."""
+        self.flush()
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"Batch writer failed: {self._error}") from self._error
+
+    def __enter__(self) -> "BatchWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        # Records already fetched are complete on their own, so keep them even
+        # if the producer crashed part way through.
+        self.close()
+
+
+def ingest(solicitations: Iterable[Solicitation], writer: Optional[BatchWriter] = None) -> BatchWriter:
+    """
+    Stream solicitations into the database in batches.
+    :param writer: Writer to use; pass one in to read its saved_ids even if the source raises
+    :return: The finished writer, for its saved_count and saved_ids
+    """
+    writer = writer or BatchWriter()
+    with writer:
+        for solicitation in solicitations:
+            writer.put(solicitation)
+    return writer
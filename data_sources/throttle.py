@@ -0,0 +1,222 @@
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import requests
+
+from config import HTTP_INITIAL_CONCURRENCY, HTTP_MAX_CONCURRENCY
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS
+
+T = TypeVar("T")
+
+# Responses that mean "slow down" rather than "this item is bad"
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    """The request failed in a way that may succeed later (throttled, 5xx, timeout)."""
+
+
+class CircuitOpen(RetryableError):
+    """The host has failed too often recently and is not being called."""
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    successes: int = 0
+    failures: int = 0
+    rejected: int = 0
+    max_concurrency: int = 0
+    peak_in_flight: int = 0
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one host.
+
+    Each healthy response grows the limit by 1/limit, so it rises by about one
+    per round of requests. A throttled, failed or slow response halves it, at
+    most once per second so a burst of bad responses from one round only counts
+    once. Slow means more than twice the fastest latency seen for the same
+    endpoint, as one host can serve both large listing pages and small detail
+    lookups.
+    """
+
+    def __init__(self, initial: int = HTTP_INITIAL_CONCURRENCY, maximum: int = HTTP_MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.in_flight = 0
+        self.min_latency: Dict[str, float] = {}
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        """Wait for a slot and return the number of requests now in flight."""
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self.in_flight += 1
+            return self.in_flight
+
+    def release(self, latency: float, healthy: bool, retry_after: Optional[float] = None,
+                endpoint: str = "") -> None:
+        """
+        :param endpoint: What was requested, e.g. "GET /details", whose latencies are compared with each other
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if healthy:
+                fastest = min(self.min_latency.get(endpoint, latency), latency)
+                self.min_latency[endpoint] = fastest
+                healthy = latency <= fastest * 2 + 0.05
+            if healthy:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif now - self._last_decrease >= 1.0:
+                self.limit = max(1.0, self.limit / 2)
+                self._last_decrease = now
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Stop calling a host after CIRCUIT_FAILURE_THRESHOLD consecutive failures.
+    After CIRCUIT_RESET_SECONDS one trial request is let through; success closes
+    the circuit again, failure re-opens it.
+    """
+
+    def __init__(self, threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self._trial_running = True
+            return True
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._trial_running = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+def retry_with_backoff(fn: Callable[[], T], attempts: int, base_delay: float = 1.0) -> T:
+    """Call fn, retrying RetryableError with exponential backoff and re-raising the last one."""
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except RetryableError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(base_delay * 2 ** attempt)
+    raise ValueError("attempts must be at least 1")
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class HostGovernor:
+    """
+    Adaptive limiter, circuit breaker and per-run stats for one host. Every
+    endpoint on the host shares the concurrency limit and the breaker.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.limiter = AdaptiveLimiter()
+        self.breaker = CircuitBreaker()
+        self.stats = HostStats()
+        self._lock = threading.Lock()
+
+    def call(self, send: Callable[[], requests.Response], endpoint: str = "") -> requests.Response:
+        """
+        Run one request under the host's limits.
+        :param endpoint: e.g. "POST /search", so its latency is only judged against the same endpoint's
+        :raises RetryableError: on throttling, 5xx, timeouts, connection errors or an open circuit
+        """
+        if not self.breaker.allow():
+            with self._lock:
+                self.stats.rejected += 1
+            raise CircuitOpen(f"Circuit open for {self.host}")
+
+        in_flight = self.limiter.acquire()
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.peak_in_flight = max(self.stats.peak_in_flight, in_flight)
+            self.stats.max_concurrency = max(self.stats.max_concurrency, int(self.limiter.limit))
+
+        start = time.monotonic()
+        try:
+            response = send()
+        except (requests.Timeout, requests.ConnectionError) as e:
+            self._finish(start, endpoint, ok=False)
+            raise RetryableError(f"{type(e).__name__} calling {self.host}: {e}") from e
+        except BaseException:
+            self._finish(start, endpoint, ok=False)
+            raise
+
+        if response.status_code in THROTTLE_STATUSES:
+            self._finish(start, endpoint, ok=False, retry_after=retry_after_seconds(response))
+            raise RetryableError(f"{self.host} returned {response.status_code}")
+        self._finish(start, endpoint, ok=True)
+        return response
+
+    def _finish(self, start: float, endpoint: str, ok: bool, retry_after: Optional[float] = None) -> None:
+        self.limiter.release(time.monotonic() - start, ok, retry_after, endpoint)
+        self.breaker.record(ok)
+        with self._lock:
+            if ok:
+                self.stats.successes += 1
+            else:
+                self.stats.failures += 1
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = HostStats(max_concurrency=int(self.limiter.limit))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"host": self.host, "limit": round(self.limiter.limit, 1), **asdict(self.stats)}
+
+
+_governors: Dict[str, HostGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def governor_for(url: str) -> HostGovernor:
+    host = urlsplit(url).netloc
+    with _governors_lock:
+        if host not in _governors:
+            _governors[host] = HostGovernor(host)
+        return _governors[host]
@@ -1,12 +1,27 @@
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Any, Dict, List
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 from data_sources.Solicitation import Solicitation, Solicitations
-from storage.db import save_solicitations, clear_solicitations_by_source
+from data_sources.http_cache import http
+from data_sources.pipeline import BatchWriter, ingest, normalize
+from data_sources.throttle import RetryableError, governor_for, retry_with_backoff
+from exceptions import IncompleteFetchError
+from storage.db import delete_solicitations_not_in, get_source_state, set_source_watermark
+from storage.db import defer_solicitations, get_deferred_solicitations, clear_deferred_solicitations
+from storage.models import SourceState
+from log import get_logger, span, bind_context
+from config import ESBD_LOOKBACK_DAYS, ESBD_OVERLAP_DAYS, ESBD_FULL_RECONCILE_HOURS
+from config import ESBD_PAGE_WORKERS, ESBD_DETAIL_WORKERS, ESBD_RETRY_ATTEMPTS, ESBD_BASE_URL
 
-ESBD_URL = "https://www.txsmartbuy.gov/app/extensions/CPA/CPAMain/1.0.0/services/ESBD.Service.ss"
-DETAILS_API_URL = "https://www.txsmartbuy.gov/app/extensions/CPA/CPAMain/1.0.0/services/ESBD.Details.Service.ss"
+log = get_logger(__name__)
+
+SOURCE_NAME = "TXSMARTBUY_ESBD"
+
+ESBD_URL = f"{ESBD_BASE_URL}/app/extensions/CPA/CPAMain/1.0.0/services/ESBD.Service.ss"
+DETAILS_API_URL = f"{ESBD_BASE_URL}/app/extensions/CPA/CPAMain/1.0.0/services/ESBD.Details.Service.ss"
 
 
 def fetch_solicitation_details(solicitation_id: str) -> str:
@@ -14,6 +29,7 @@ def fetch_solicitation_details(solicitation_id: str) -> str:
     Fetch detailed description for a specific solicitation using the API.
     :param solicitation_id: The solicitation ID (e.g., "2025-003")
     :return: Description text or empty string if not found
+    :raises RetryableError: if the API is throttling or unavailable, so the caller can retry later
     """
     try:
         params = {
@@ -23,7 +39,7 @@ def fetch_solicitation_details(solicitation_id: str) -> str:
             "urlRoot": "esbd"
         }
 
-        response = requests.get(DETAILS_API_URL, params=params)
+        response = http.get(DETAILS_API_URL, params=params)
         response.raise_for_status()
 
         data = response.json()
@@ -36,30 +52,25 @@ def fetch_solicitation_details(solicitation_id: str) -> str:
 
         return ""
 
+    except RetryableError:
+        raise
     except Exception as e:
-        print(
-            f"Error fetching details for solicitation {solicitation_id}: {e}")
+        log.sampled(logging.WARNING, "Error fetching solicitation details", solicitation=solicitation_id, error=e)
         return ""
 
 
-def esbd_from_dict(record: Dict[str, Any]) -> Solicitation:
+def esbd_listing_from_dict(record: Dict[str, Any]) -> Solicitation:
     """
-    Create a Solicitation from a Texas SmartBuy ESBD record.
+    Create a Solicitation from a Texas SmartBuy ESBD listing without fetching its description.
     """
     solicitation_id = record.get("solicitationId", "")
-
-    # Try to fetch description if we have a solicitation ID
-    description = ""
-    if solicitation_id:
-        description = fetch_solicitation_details(solicitation_id)
-
     return Solicitation(
         Id=str(record.get("internalid", "")),
-        EntityName="TXSMARTBUY_ESBD",
+        EntityName=SOURCE_NAME,
         solicitation_id=str(record.get("internalid", "")),
         solicitation_number=solicitation_id,
         title=record.get("title", ""),
-        description=description,
+        description="",
         department=record.get("agencyName", ""),
         status=record.get("statusName", ""),
         open_date=record.get("postingDate", ""),
@@ -68,6 +79,94 @@ def esbd_from_dict(record: Dict[str, Any]) -> Solicitation:
     )
 
 
+def esbd_from_dict(record: Dict[str, Any]) -> Solicitation:
+    """
+    Create a Solicitation from a Texas SmartBuy ESBD record.
+    """
+    solicitation = esbd_listing_from_dict(record)
+
+    # Try to fetch description if we have a solicitation ID
+    if solicitation.solicitation_number:
+        solicitation.description = fetch_solicitation_details(
+            solicitation.solicitation_number)
+
+    return solicitation
+
+
+def iter_txsmartbuy_esbd_pages(params: Dict[str, Any] = {}) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield the listing lines of every ESBD results page, first page first.
+    Remaining pages are fetched concurrently, but only a few requests are kept in
+    flight ahead of the consumer, so a slow consumer pauses fetching.
+    :param params: Optional query parameters shared by every page request.
+    """
+    # Fetch first page to get total records info
+    first_page = fetch_txsmartbuy_esbd_data({**params, "page": 1})
+
+    # Extract pagination info
+    total_records = first_page.get("totalRecordsFound", 0)
+    records_per_page = first_page.get(
+        "recordsPerPage", 24)  # Default fallback
+    total_pages = (total_records + records_per_page -
+                   1) // records_per_page
+
+    log.info("Fetching Texas SmartBuy pages", records=total_records, per_page=records_per_page,
+             pages=total_pages, workers=ESBD_PAGE_WORKERS)
+
+    yield first_page.get("lines", [])
+
+    def fetch_page(page_num: int) -> Optional[List[Dict[str, Any]]]:
+        """Helper function to fetch a single page, returning None if it failed"""
+        try:
+            with span("esbd_page", page=page_num) as page_span:
+                page_data = fetch_txsmartbuy_esbd_data({**params, "page": page_num})
+                page_lines = page_data.get("lines", [])
+                page_span.set(records=len(page_lines))
+            return page_lines
+        except Exception as e:
+            log.warning("Error fetching page", page=page_num, error=e)
+            return None
+
+    # Pool threads don't inherit the refresh's trace
+    fetch_page_traced = bind_context(fetch_page)
+
+    failed_pages: List[int] = []
+    remaining_pages = iter(range(2, total_pages + 1))
+    with ThreadPoolExecutor(max_workers=ESBD_PAGE_WORKERS) as executor:
+        # Keep a bounded window of page requests in flight
+        in_flight: Dict["Future[Optional[List[Dict[str, Any]]]]", int] = {}
+        for page in islice(remaining_pages, ESBD_PAGE_WORKERS * 2):
+            in_flight[executor.submit(fetch_page_traced, page)] = page
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = in_flight.pop(future)
+                next_page = next(remaining_pages, None)
+                if next_page is not None:
+                    in_flight[executor.submit(fetch_page_traced, next_page)] = next_page
+                page_lines = future.result()
+                if page_lines is None:
+                    failed_pages.append(page)
+                else:
+                    yield page_lines
+
+    # Give failed pages another go once the rest of the run has finished
+    still_failed: List[int] = []
+    for page in sorted(failed_pages):
+        try:
+            page_data = retry_with_backoff(
+                lambda: fetch_txsmartbuy_esbd_data({**params, "page": page}), ESBD_RETRY_ATTEMPTS)
+        except Exception as e:
+            log.error("Giving up on page", page=page, error=e)
+            still_failed.append(page)
+            continue
+        yield page_data.get("lines", [])
+
+    if still_failed:
+        raise IncompleteFetchError(f"Failed to fetch ESBD pages {still_failed}")
+
+
 def fetch_txsmartbuy_esbd_data(params: Dict[str, Any] = {}) -> Any:
     """
     Fetch data from the Texas SmartBuy ESBD endpoint.
@@ -77,68 +176,25 @@ def fetch_txsmartbuy_esbd_data(params: Dict[str, Any] = {}) -> Any:
     """
     # If no page is specified, fetch all pages
     if "page" not in params:
-        print("Fetching all Texas SmartBuy ESBD data with pagination...")
+        log.info("Fetching all Texas SmartBuy ESBD data with pagination")
 
-        # Fetch first page to get total records info
-        first_page = fetch_txsmartbuy_esbd_data({"page": 1})
-
-        # Extract pagination info
-        total_records = first_page.get("totalRecordsFound", 0)
-        records_per_page = first_page.get(
-            "recordsPerPage", 24)  # Default fallback
-        total_pages = (total_records + records_per_page -
-                       1) // records_per_page
-
-        print(
-            f"Total records: {total_records}, Records per page: {records_per_page}, Total pages: {total_pages}")
-
-        # Start with first page data
-        all_lines = first_page.get("lines", [])
-
-        # Fetch remaining pages using threading (3 concurrent requests)
-        print(
-            f"Fetching remaining {total_pages - 1} pages with 5 concurrent threads...")
-
-        def fetch_page(page_num: int) -> List[Dict[str, Any]]:
-            """Helper function to fetch a single page"""
-            try:
-                page_data = fetch_txsmartbuy_esbd_data({"page": page_num})
-                page_lines = page_data.get("lines", [])
-                print(f"Page {page_num}: {len(page_lines)} records")
-                return page_lines
-            except Exception as e:
-                print(f"Error fetching page {page_num}: {e}")
-                return []
-
-        # Use ThreadPoolExecutor to run 3 concurrent requests
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            # Submit all page requests
-            future_to_page = {
-                executor.submit(fetch_page, page): page
-                for page in range(2, total_pages + 1)
-            }
-
-            # Collect results as they complete
-            for future in as_completed(future_to_page):
-                page_lines = future.result()
-                all_lines.extend(page_lines)
+        all_lines: List[Dict[str, Any]] = []
+        for page_lines in iter_txsmartbuy_esbd_pages(params):
+            all_lines.extend(page_lines)
 
         # Return combined data in same format as single page
         return {
             "lines": all_lines,
-            "totalRecordsFound": total_records,
-            "recordsPerPage": records_per_page,
+            "totalRecordsFound": len(all_lines),
+            "recordsPerPage": len(all_lines),
             "page": 1  # Indicate this is now all data
         }
 
-        # Set default parameters with date filtering for last month
-    from datetime import datetime, timedelta
-
-    # Calculate last 30 days date range
+    # Default to the full lookback window; callers narrow it with startDate
     today = datetime.now()
-    thirty_days_ago = today - timedelta(days=30)
+    lookback_start = today - timedelta(days=ESBD_LOOKBACK_DAYS)
 
-    start_date = thirty_days_ago.strftime("%m/%d/%Y")
+    start_date = lookback_start.strftime("%m/%d/%Y")
     end_date = today.strftime("%m/%d/%Y")
 
     default_params = {
@@ -151,118 +207,170 @@ def fetch_txsmartbuy_esbd_data(params: Dict[str, Any] = {}) -> Any:
     # Merge with any provided params, with provided params taking precedence
     request_params = {**default_params, **params}
 
-    response = requests.post(ESBD_URL, json=request_params)
+    # The date window moves every day, so leave it out of recorded request keys
+    response = http.post(ESBD_URL, json=request_params,
+                         replay_ignore=("startDate", "endDate"))
     response.raise_for_status()
     return response.json()
 
 
-def fetch_txsmartbuy_solicitations(fetch_descriptions: bool = True) -> Solicitations:
+def iter_txsmartbuy_solicitations(fetch_descriptions: bool = True, since: Optional[datetime] = None,
+                                  pending: Iterable[Solicitation] = (),
+                                  deferred: Optional[List[Solicitation]] = None) -> Iterator[Solicitation]:
+    """
+    Stream solicitations from Texas SmartBuy ESBD one results page at a time.
+    Solicitations whose description can't be fetched because the API is throttling
+    or failing are retried at the end of the run rather than yielded blank.
+    :param fetch_descriptions: Whether to fetch detailed descriptions (slower but more complete)
+    :param since: Only request listings posted on or after this date (defaults to the full lookback window)
+    :param pending: Listings deferred by an earlier run, retried first
+    :param deferred: Receives the listings that still failed, for the caller to keep for later
+    :raises IncompleteFetchError: after yielding everything else, if some results pages could not be fetched
+    """
+    params: Dict[str, Any] = {}
+    if since is not None:
+        params["startDate"] = since.strftime("%m/%d/%Y")
+
+    retry_later: List[Solicitation] = []
+
+    def fetch_description_for_solicitation(solicitation: Solicitation) -> Optional[Solicitation]:
+        """Helper function to fetch description for a single solicitation, or None to retry later"""
+        if solicitation.solicitation_number:
+            try:
+                solicitation.description = fetch_solicitation_details(
+                    solicitation.solicitation_number)
+            except RetryableError as e:
+                log.sampled(logging.WARNING, "Will retry description later",
+                            solicitation=solicitation.solicitation_number, error=e)
+                return None
+        return solicitation
+
+    def with_descriptions(listings: List[Solicitation]) -> List[Solicitation]:
+        if not fetch_descriptions:
+            return listings
+        # Fetch this page's descriptions concurrently before moving on
+        results = list(executor.map(bind_context(fetch_description_for_solicitation), listings))
+        retry_later.extend(l for l, r in zip(listings, results) if r is None)
+        return [r for r in results if r is not None]
+
+    completed_count = 0
+    incomplete: Optional[IncompleteFetchError] = None
+    with ThreadPoolExecutor(max_workers=ESBD_DETAIL_WORKERS) as executor:
+        pages = iter_txsmartbuy_esbd_pages(params)
+        batches = (list(normalize(page_lines, esbd_listing_from_dict)) for page_lines in pages)
+        try:
+            for listings in chain([list(pending)], batches):
+                listings = with_descriptions(listings)
+                completed_count += len(listings)
+                log.debug("Completed Texas SmartBuy solicitations", count=completed_count)
+                yield from listings
+        except IncompleteFetchError as e:
+            # Still retry the descriptions we have before reporting the missing pages
+            incomplete = e
+
+    for solicitation in retry_later:
+        try:
+            solicitation.description = retry_with_backoff(
+                lambda: fetch_solicitation_details(solicitation.solicitation_number or ""), ESBD_RETRY_ATTEMPTS)
+        except RetryableError as e:
+            log.warning("Deferring solicitation to the next refresh",
+                        solicitation=solicitation.solicitation_number, error=e)
+            if deferred is not None:
+                deferred.append(solicitation)
+            continue
+        yield solicitation
+
+    if incomplete is not None:
+        raise incomplete
+
+
+def fetch_txsmartbuy_solicitations(fetch_descriptions: bool = True, since: Optional[datetime] = None) -> Solicitations:
     """
     Fetch solicitations from Texas SmartBuy ESBD and return as Solicitations object.
     :param fetch_descriptions: Whether to fetch detailed descriptions (slower but more complete)
+    :param since: Only request listings posted on or after this date (defaults to the full lookback window)
     """
-    print("Starting Texas SmartBuy ESBD data fetch...")
+    log.info("Starting Texas SmartBuy ESBD data fetch")
 
     try:
-        # Fetch all data with pagination
-        data = fetch_txsmartbuy_esbd_data()
-
-        # Convert to Solicitations
-        lines = data.get("lines", [])
-
-        if fetch_descriptions:
-            # Create solicitations with concurrent detail fetching
-            basic_solicitations = []
-            for record in lines:
-                solicitation_id = record.get("solicitationId", "")
-                basic_solicitations.append(Solicitation(
-                    Id=str(record.get("internalid", "")),
-                    EntityName="TXSMARTBUY_ESBD",
-                    solicitation_id=str(record.get("internalid", "")),
-                    solicitation_number=solicitation_id,
-                    title=record.get("title", ""),
-                    description="",  # Will be filled in later
-                    department=record.get("agencyName", ""),
-                    status=record.get("statusName", ""),
-                    open_date=record.get("postingDate", ""),
-                    posted_date=record.get("postingDate", ""),
-                    url=f"https://www.txsmartbuy.gov/esbd/{solicitation_id}"
-                ))
-
-            # Fetch descriptions concurrently for solicitations that have IDs
-            total_solicitations = len(basic_solicitations)
-            print(
-                f"Fetching descriptions for {total_solicitations} solicitations...")
-
-            completed_count = 0
-
-            def fetch_description_for_solicitation(solicitation: Solicitation) -> Solicitation:
-                """Helper function to fetch description for a single solicitation"""
-                nonlocal completed_count
-                if solicitation.solicitation_number:
-                    print(
-                        f"Fetching description for {solicitation.solicitation_number} ({solicitation.title[:50]}...)")
-                    description = fetch_solicitation_details(
-                        solicitation.solicitation_number)
-                    solicitation.description = description
-                    completed_count += 1
-                    remaining = total_solicitations - completed_count
-                    print(
-                        f"✓ Completed {completed_count}/{total_solicitations} ({remaining} remaining)")
-                return solicitation
-
-            # Use ThreadPoolExecutor to fetch descriptions concurrently
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                # Submit all description fetch requests
-                future_to_solicitation = {
-                    executor.submit(fetch_description_for_solicitation, solicitation): solicitation
-                    for solicitation in basic_solicitations
-                }
-
-                # Wait for all to complete
-                for future in as_completed(future_to_solicitation):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        print(f"Error fetching description: {e}")
-                        completed_count += 1
-                        remaining = total_solicitations - completed_count
-                        print(
-                            f"✗ Error - {completed_count}/{total_solicitations} ({remaining} remaining)")
-
-            solicitations = Solicitations(basic_solicitations)
-        else:
-            # Use the original fast method without descriptions
-            solicitations = Solicitations(
-                esbd_from_dict(record)
-                for record in lines
-            )
-
-        print(
-            f"Fetched {len(solicitations)} solicitations from Texas SmartBuy")
+        deferred: List[Solicitation] = []
+        solicitations = Solicitations(
+            iter_txsmartbuy_solicitations(fetch_descriptions, since, deferred=deferred))
+        log.info("Fetched Texas SmartBuy solicitations", count=len(solicitations), failed=len(deferred))
         return solicitations
 
-    except Exception as e:
-        print(f"Error fetching Texas SmartBuy data: {e}")
+    except Exception:
+        log.exception("Error fetching Texas SmartBuy data")
         return Solicitations()
 
 
-def save_txsmartbuy_solicitations_to_db() -> None:
+def incremental_start(state: Optional[SourceState], now: datetime) -> Optional[datetime]:
     """
-    Fetch Texas SmartBuy solicitations and save them to the database.
+    Work out where an incremental refresh should start.
+    :return: The start date to request, or None if a full reconciliation is due
     """
-    print("Fetching and saving Texas SmartBuy solicitations...")
+    if not state or not state.watermark or not state.last_full_sync:
+        return None
+    if now - datetime.fromisoformat(state.last_full_sync) >= timedelta(hours=ESBD_FULL_RECONCILE_HOURS):
+        return None
+    since = datetime.fromisoformat(state.watermark) - timedelta(days=ESBD_OVERLAP_DAYS)
+    return max(since, now - timedelta(days=ESBD_LOOKBACK_DAYS))
 
-    # Clear old Texas SmartBuy solicitations
-    clear_solicitations_by_source("TXSMARTBUY_ESBD")
 
-    # Fetch new solicitations
-    solicitations = fetch_txsmartbuy_solicitations()
+def save_txsmartbuy_solicitations_to_db(full: bool = False) -> bool:
+    """
+    Fetch Texas SmartBuy solicitations and merge them into the database.
+    Ordinary refreshes only request listings since the stored watermark; a periodic
+    full reconciliation re-fetches the whole window and drops withdrawn listings.
+    :param full: Force a full reconciliation
+    :return: Whether the refresh succeeded
+    """
+    log.info("Fetching and saving Texas SmartBuy solicitations")
 
-    # Save to database
-    if solicitations:
-        save_solicitations(solicitations)
-        print(
-            f"Saved {len(solicitations)} Texas SmartBuy solicitations to database")
+    started = datetime.now()
+    since = None if full else incremental_start(get_source_state(SOURCE_NAME), started)
+    if since is None:
+        log.info("Running full Texas SmartBuy reconciliation")
     else:
-        print("No Texas SmartBuy solicitations to save")
+        log.info("Fetching recent Texas SmartBuy solicitations", since=f"{since:%m/%d/%Y}")
+
+    governor = governor_for(ESBD_URL)
+    governor.reset_stats()
+    pending = get_deferred_solicitations(SOURCE_NAME)
+    if pending:
+        log.info("Retrying deferred Texas SmartBuy solicitations", count=len(pending))
+    deferred: List[Solicitation] = []
+
+    # Stream into the database in batches; completed batches survive a crash
+    writer = BatchWriter()
+    try:
+        ingest(iter_txsmartbuy_solicitations(since=since, pending=pending, deferred=deferred), writer)
+    except IncompleteFetchError as e:
+        # Batches up to here are saved, but the watermark must not move past missing pages
+        log.error("Texas SmartBuy refresh incomplete", error=e)
+        return False
+    except Exception:
+        log.exception("Error fetching Texas SmartBuy data")
+        return False
+    finally:
+        log.info("Texas SmartBuy request stats", **governor.snapshot())
+        clear_deferred_solicitations(SOURCE_NAME, writer.saved_ids)
+        if deferred:
+            defer_solicitations(SOURCE_NAME, Solicitations(deferred), "description fetch failed")
+            log.warning("Deferred Texas SmartBuy solicitations to the next refresh", count=len(deferred))
+
+    # Leave the watermark alone on an empty result so the same window is retried
+    if not writer.saved_count and not deferred:
+        log.info("No Texas SmartBuy solicitations to save")
+        return True
+
+    log.info("Saved Texas SmartBuy solicitations", count=writer.saved_count)
+
+    if since is None:
+        # Deferred listings are still live, so don't treat them as withdrawn
+        keep_ids = writer.saved_ids | {s.solicitation_id or s.Id for s in deferred}
+        removed = delete_solicitations_not_in(SOURCE_NAME, keep_ids)
+        log.info("Removed withdrawn Texas SmartBuy solicitations", count=removed)
+
+    set_source_watermark(SOURCE_NAME, started.isoformat(timespec="seconds"), full_sync=since is None)
+    return True
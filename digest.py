@@ -0,0 +1,126 @@
+import hashlib
+import os
+from typing import Callable, Dict, List, Optional, Sequence
+
+from jinja2 import Environment, FileSystemLoader
+
+from cache import LRUCache
+from metrics import Histogram
+from log import traced
+from data_sources.Solicitation import FIELD_LABELS, Solicitation
+from config import DIGEST_FRAGMENT_CACHE_SIZE, DIGEST_BODY_CACHE_SIZE, DIGEST_MAX_ITEMS, DIGEST_MAX_BYTES
+
+# Fields shown for each entry of a digest shortened to fit its budget
+SUMMARY_FIELDS = ("posted_date", "open_date", "department")
+# Room left in DIGEST_MAX_BYTES for the "see all" footer
+FOOTER_BYTES = 512
+
+# Compiled once per process. Values aren't escaped, matching the digests built
+# by string concatenation before, since some sources send HTML descriptions.
+_env = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates", "email")),
+    autoescape=False,
+    trim_blocks=True,
+)
+_item_template = _env.get_template("solicitation.html")
+_digest_template = _env.get_template("digest.html")
+
+
+RENDER_SECONDS = Histogram("digest_render_seconds", "Time to render one digest email body")
+
+# Both caches are keyed by content, so an entry is only ever reused for
+# byte-identical output, however long it lives
+_fragments: LRUCache[str] = LRUCache(DIGEST_FRAGMENT_CACHE_SIZE)
+_bodies: LRUCache[str] = LRUCache(DIGEST_BODY_CACHE_SIZE)
+
+
+def solicitation_link(solicitation: Solicitation) -> str:
+    # Use the solicitation's URL if available, otherwise fall back to EVP format
+    if solicitation.url:
+        return solicitation.url
+    return f"https://evp.nc.gov/solicitations/details/?id={solicitation.Id}"
+
+
+def content_key(solicitation: Solicitation) -> str:
+    """Hash of everything that appears in a solicitation's digest entry."""
+    parts = [solicitation_link(solicitation), str(solicitation.title)]
+    parts.extend(str(getattr(solicitation, field, "") or "") for field in FIELD_LABELS)
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+
+def render_solicitation(solicitation: Solicitation, key: Optional[str] = None, summary: bool = False) -> str:
+    """
+    The <li> entry for one solicitation, rendered once per distinct content.
+    :param summary: Leave out long fields such as the description
+    """
+    key = (key or content_key(solicitation)) + (":summary" if summary else "")
+    fragment = _fragments.get(key)
+    if fragment is None:
+        fields = [
+            (label, getattr(solicitation, field, ""))
+            for field, label in FIELD_LABELS.items()
+            if field != "title" and getattr(solicitation, field, "")
+            and (not summary or field in SUMMARY_FIELDS)
+        ]
+        fragment = _item_template.render(
+            title_label=FIELD_LABELS.get("title", "Name"),
+            link=solicitation_link(solicitation),
+            solicitation=solicitation,
+            fields=fields,
+        )
+        _fragments.put(key, fragment)
+    return fragment
+
+
+def render_digest(solicitations: Sequence[Solicitation]) -> str:
+    """
+    HTML body listing solicitations. Users whose matches are identical get the
+    same cached body back without re-rendering.
+    """
+    if not solicitations:
+        return "No solicitations found."
+    keys = [content_key(s) for s in solicitations]
+    digest_key = hashlib.sha1("\n".join(keys).encode()).hexdigest()
+    body = _bodies.get(digest_key)
+    if body is None:
+        items = [render_solicitation(s, key) for s, key in zip(solicitations, keys)]
+        body = _digest_template.render(items=items)
+        _bodies.put(digest_key, body)
+    return body
+
+
+@RENDER_SECONDS.time()
+@traced("render")
+def render_budgeted_digest(solicitations: Sequence[Solicitation], full_results_link: Callable[[], str]) -> str:
+    """
+    HTML body for a digest email, kept within DIGEST_MAX_ITEMS entries and
+    DIGEST_MAX_BYTES. A digest over budget lists as many summary entries as fit
+    and ends with a link to the rest.
+    :param full_results_link: Stores the full result set and returns a URL to it; only called when over budget
+    """
+    if len(solicitations) <= DIGEST_MAX_ITEMS:
+        body = render_digest(solicitations)
+        if len(body.encode()) <= DIGEST_MAX_BYTES:
+            return body
+
+    items: List[str] = []
+    size = FOOTER_BYTES
+    for solicitation in solicitations[:DIGEST_MAX_ITEMS]:
+        fragment = render_solicitation(solicitation, summary=True)
+        size += len(fragment.encode()) + 1
+        if size > DIGEST_MAX_BYTES and items:
+            break
+        items.append(fragment)
+    return _digest_template.render(items=items, total=len(solicitations), more_link=full_results_link())
+
+
+def clear_caches() -> None:
+    _fragments.clear()
+    _bodies.clear()
+
+
+def cache_stats() -> Dict[str, int]:
+    return {
+        "fragment_hits": _fragments.hits, "fragment_misses": _fragments.misses,
+        "body_hits": _bodies.hits, "body_misses": _bodies.misses,
+    }
@@ -1,34 +1,85 @@
 import smtplib
+import time
 
 from datetime import datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from data_sources.Solicitation import Solicitations
+from smtp_pool import smtp_pool
+from metrics import Histogram
+from log import traced
 
-from env import SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, FROM_ADDRESS
+from env import FROM_ADDRESS
 from exceptions import MailError
 
+SMTP_SEND_SECONDS = Histogram("smtp_send_seconds", "Time to hand one message to the SMTP server")
 
-def send_summary_email(to_address: str, solicitations: Solicitations):
-    body = solicitations.to_html()
 
+def summary_subject() -> str:
     today = datetime.now().strftime("%Y-%m-%d")
+    return f"Solicitation Summary for {today}"
 
-    send_email(to_address, f"Solicitation Summary for {today}", body)
 
+def build_message(to_address: str, subject: str, body: str) -> str:
+    msg = MIMEMultipart()
+    msg["From"] = FROM_ADDRESS
+    msg["To"] = to_address
+    msg["Subject"] = subject
 
-def send_email(to_address: str, subject: str, body: str):
+    msg.attach(MIMEText(body, "html"))
+    return msg.as_string()
+
+
+class EnvelopeDisconnected(smtplib.SMTPServerDisconnected):
+    """The session dropped before DATA, so nothing was delivered and the send can be retried."""
+
+
+def _transmit(server: smtplib.SMTP, to_address: str, message: str) -> None:
+    """SMTP.sendmail for one recipient, raising EnvelopeDisconnected if the session drops before DATA."""
     try:
-        msg = MIMEMultipart()
-        msg["From"] = FROM_ADDRESS
-        msg["To"] = to_address
-        msg["Subject"] = subject
+        server.ehlo_or_helo_if_needed()
+        code, response = server.mail(FROM_ADDRESS)
+        if code != 250:
+            server.rset()
+            raise smtplib.SMTPSenderRefused(code, response, FROM_ADDRESS)
+        code, response = server.rcpt(to_address)
+        if code not in (250, 251):
+            server.rset()
+            raise smtplib.SMTPRecipientsRefused({to_address: (code, response)})
+    except smtplib.SMTPServerDisconnected as e:
+        raise EnvelopeDisconnected(str(e)) from e
+    code, response = server.data(message)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPDataError(code, response)
 
-        msg.attach(MIMEText(body, "html"))
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.sendmail(FROM_ADDRESS, to_address, msg.as_string())
+@traced("send")
+def send_message(to_address: str, message: str) -> None:
+    """
+    Send a message built by build_message over a pooled SMTP session. Failures
+    after DATA are left to the outbox to retry, as the server may have
+    delivered the message already.
+    """
+    started = time.monotonic()
+    try:
+        try:
+            with smtp_pool.connection() as server:
+                _transmit(server, to_address, message)
+        except EnvelopeDisconnected:
+            # The server closed a pooled session between the health check and the send
+            with smtp_pool.connection() as server:
+                _transmit(server, to_address, message)
     except Exception as e:
+        SMTP_SEND_SECONDS.observe(time.monotonic() - started, status="failed")
         raise MailError(f"Failed to send email: {e}") from e
+    SMTP_SEND_SECONDS.observe(time.monotonic() - started, status="ok")
+
+
+def send_email(to_address: str, subject: str, body: str) -> int:
+    """
+    Send straight away, blocking on SMTP. Most callers should use outbox.queue_email.
+    :return: Size of the sent message in bytes
+    """
+    message = build_message(to_address, subject, body)
+    send_message(to_address, message)
+    return len(message.encode())
@@ -11,3 +11,6 @@ MAGIC_LINK_EXPIRY_SECONDS = 300  # 5 minutes
 COOKIE_SECRET = "your-secret-key"  # Replace with a secure random key
 
 URI = "https://yourdomain.com"  # Replace with your actual domain
+
+# Any setting in config.py can be overridden here, e.g.
+# JOB_WORKERS = 8
@@ -1 +1,3 @@
 class MailError(Exception): pass
+class IncompleteFetchError(Exception): pass
+class LeaseLostError(Exception): pass
@@ -1,8 +1,17 @@
+import hashlib
+import logging
 import json
+import threading
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
+from cache import LRUCache
 from data_sources.Solicitation import Solicitation, Solicitations
+from storage.db import get_all_solicitations, get_corpus_generation
+from log import get_logger
+from config import PREVIEW_CACHE_SIZE
+
+log = get_logger(__name__)
 
 
 # def evaluate_filter(criteria: Dict[str, Any], solicitation) -> bool:
@@ -39,7 +48,7 @@ def evaluate_filter(criteria: Dict[str, Any] | str, solicitation: 'Solicitation'
                         date_val = datetime.strptime(
                             date_str, "%m/%d/%Y").date()
                 except Exception:
-                    print(f"Error parsing {field}: {date_str}")
+                    log.sampled(logging.WARNING, "Error parsing date", field=field, value=date_str)
                     return False
                 today = datetime.today().date()
                 if value == "last_1_day":
@@ -69,3 +78,36 @@ def filter_solicitations(solicitations: Solicitations, filters: List[Dict[str, A
         s for s in solicitations
         if any(evaluate_filter(f["criteria"], s) for f in filters)
     ])
+
+
+# The stored solicitations as of a corpus generation, shared by previews until they change
+_corpus: Tuple[Optional[int], Solicitations] = (None, Solicitations())
+_corpus_lock = threading.Lock()
+# Matches by criteria hash and corpus generation
+_previews: LRUCache[Solicitations] = LRUCache(PREVIEW_CACHE_SIZE)
+
+
+def corpus_snapshot() -> Tuple[int, Solicitations]:
+    """Every stored solicitation, reloaded only when the corpus generation moves on."""
+    global _corpus
+    generation = get_corpus_generation()
+    with _corpus_lock:
+        if _corpus[0] != generation:
+            _corpus = (generation, get_all_solicitations())
+        return generation, _corpus[1]
+
+
+def preview_matches(criteria: Dict[str, Any]) -> Solicitations:
+    """
+    Solicitations matching unsaved criteria from the filter editor. Repeat
+    requests for the same criteria are answered from cache until the stored
+    solicitations change.
+    """
+    generation, corpus = corpus_snapshot()
+    criteria_hash = hashlib.sha1(json.dumps(criteria, sort_keys=True).encode()).hexdigest()
+    key = f"{generation}:{criteria_hash}"
+    matches = _previews.get(key)
+    if matches is None:
+        matches = Solicitations(s for s in corpus if evaluate_filter(criteria, s))
+        _previews.put(key, matches)
+    return matches
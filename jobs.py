@@ -0,0 +1,226 @@
+import json
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from storage.db import claim_job, heartbeat_job, complete_job, fail_job, acquire_lock, release_lock
+from storage.db import set_job_progress, job_lease_held
+from storage.models import Job
+from timing import summarize
+from metrics import Counter, Histogram
+from log import get_logger, span
+from exceptions import LeaseLostError
+from config import JOB_WORKERS, JOB_LEASE_SECONDS, JOB_POLL_SECONDS, JOB_TIMEOUT_SECONDS, JOB_RETRY_SECONDS
+from config import LEADER_LEASE_SECONDS
+
+log = get_logger(__name__)
+
+# Called with a job's payload; raising fails the attempt
+Handler = Callable[[Dict[str, Any]], None]
+# Called with the job and error message once a job has failed for good
+FailureHandler = Callable[[Job, str], None]
+
+
+JOBS_FINISHED = Counter("jobs_finished_total", "Job attempts finished, by kind and outcome")
+JOB_SECONDS = Histogram("job_seconds", "Time to run one job attempt, by kind")
+
+# The job each worker thread is running, for report_progress
+_current = threading.local()
+
+
+def report_progress(progress: str) -> None:
+    """Record what the calling thread's job is doing; does nothing outside a job."""
+    job_id = getattr(_current, "job_id", None)
+    if job_id is None:
+        return
+    try:
+        set_job_progress(job_id, progress)
+    except Exception as e:
+        log.warning("Error recording job progress", job_id=job_id, error=e)
+
+
+def check_lease() -> None:
+    """
+    Raise LeaseLostError if the calling thread's job has timed out or been taken
+    over by another worker, e.g. before a handler does something that must not
+    happen twice. Does nothing outside a job.
+    """
+    job_id = getattr(_current, "job_id", None)
+    if job_id is not None and not job_lease_held(job_id, _current.owner):
+        raise LeaseLostError(f"Job {job_id} no longer holds its lease")
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class LeaderLease:
+    """
+    Elect one process to do a piece of background work, e.g. scheduling.
+
+    Every process runs one; a background thread keeps trying to take or renew the
+    lease, so if the leader dies another process takes over within
+    LEADER_LEASE_SECONDS.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._started = False
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._renew_loop, daemon=True).start()
+
+    def _renew_loop(self) -> None:
+        while True:
+            try:
+                leader = acquire_lock(self.name, self.owner, LEADER_LEASE_SECONDS)
+            except Exception as e:
+                log.error("Error renewing lease", lease=self.name, error=e)
+                leader = False
+            if leader != self.is_leader:
+                log.info(f"{'Became' if leader else 'No longer'} leader", lease=self.name, owner=self.owner)
+            self.is_leader = leader
+            time.sleep(LEADER_LEASE_SECONDS / 3)
+
+    def wait_for_leadership(self) -> None:
+        self.start()
+        while not self.is_leader:
+            time.sleep(LEADER_LEASE_SECONDS / 3)
+
+    def release(self) -> None:
+        if self.is_leader:
+            self.is_leader = False
+            release_lock(self.name, self.owner)
+
+
+class JobWorker:
+    """
+    Run queued jobs from the database on JOB_WORKERS threads.
+
+    Every process can run one; claims are atomic, so each job runs once. While a
+    job runs its lease is renewed, and if the process dies the lease expires and
+    another worker picks the job up. A job still running after its kind's timeout
+    (JOB_TIMEOUT_SECONDS unless registered with another) is failed for good and
+    reported, though its thread is left to finish.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Handler] = {}
+        self._failure_handlers: Dict[str, FailureHandler] = {}
+        self._timeouts: Dict[str, float] = {}
+        self._wake = threading.Event()
+        self._durations: List[float] = []
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, handler: Handler, on_failure: Optional[FailureHandler] = None,
+                 timeout: float = JOB_TIMEOUT_SECONDS) -> None:
+        """
+        :param timeout: Seconds an attempt may run before it is failed for good
+        """
+        self._handlers[kind] = handler
+        self._timeouts[kind] = timeout
+        if on_failure is not None:
+            self._failure_handlers[kind] = on_failure
+
+    def notify(self) -> None:
+        """Wake idle workers in this process, e.g. right after enqueueing."""
+        self._wake.set()
+
+    def start(self, workers: int = JOB_WORKERS) -> None:
+        log.info("Starting job workers", workers=workers)
+        for _ in range(workers):
+            threading.Thread(target=self._loop, daemon=True).start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                job = claim_job(worker_id(), JOB_LEASE_SECONDS)
+            except Exception as e:
+                log.error("Error claiming job", error=e)
+                job = None
+            if job is None:
+                self._report_batch()
+                self._wake.wait(JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            self._execute(job)
+
+    def _report_batch(self) -> None:
+        """Log the latency spread of the jobs run since the queue was last empty."""
+        with self._lock:
+            durations, self._durations = self._durations, []
+        if durations:
+            stats = summarize(durations)
+            log.info("Ran jobs", count=stats["count"], p50_seconds=round(stats["p50"], 1),
+                     p95_seconds=round(stats["p95"], 1), max_seconds=round(stats["max"], 1))
+
+    def _execute(self, job: Job) -> None:
+        owner = worker_id()
+        started = time.monotonic()
+        done = threading.Event()
+        timed_out = threading.Event()
+        timeout = self._timeouts.get(job.kind, JOB_TIMEOUT_SECONDS)
+
+        def keep_lease() -> None:
+            while not done.wait(JOB_LEASE_SECONDS / 3):
+                if time.monotonic() - started > timeout:
+                    timed_out.set()
+                    self._give_up(job, owner, f"Timed out after {timeout:.0f}s")
+                    return
+                heartbeat_job(job.id, owner, JOB_LEASE_SECONDS)
+
+        threading.Thread(target=keep_lease, daemon=True).start()
+        _current.job_id, _current.owner = job.id, owner
+        try:
+            with span("job", kind=job.kind, job_id=job.id, attempt=job.attempts):
+                handler = self._handlers[job.kind]
+                handler(json.loads(job.payload))
+        except LeaseLostError:
+            # Already failed by the timeout, or another worker is running it again
+            done.set()
+            outcome = "timed_out" if timed_out.is_set() else "lease_lost"
+            log.warning("Job attempt abandoned after losing its lease", job_id=job.id, kind=job.kind,
+                        attempt=job.attempts)
+        except Exception as e:
+            done.set()
+            outcome = "timed_out" if timed_out.is_set() else "failed"
+            if not timed_out.is_set():
+                error = f"{type(e).__name__}: {e}"
+                log.warning("Job attempt failed", job_id=job.id, kind=job.kind, attempt=job.attempts, error=error)
+                if not fail_job(job.id, owner, error, JOB_RETRY_SECONDS * job.attempts):
+                    self._report_failure(job, error)
+        else:
+            done.set()
+            outcome = "timed_out" if timed_out.is_set() else "ok"
+            if not timed_out.is_set():
+                complete_job(job.id, owner)
+        finally:
+            _current.job_id = None
+            duration = time.monotonic() - started
+            with self._lock:
+                self._durations.append(duration)
+        JOBS_FINISHED.inc(kind=job.kind, status=outcome)
+        JOB_SECONDS.observe(duration, kind=job.kind)
+
+    def _give_up(self, job: Job, owner: str, error: str) -> None:
+        fail_job(job.id, owner, error, retry_delay=None)
+        self._report_failure(job, error)
+
+    def _report_failure(self, job: Job, error: str) -> None:
+        on_failure = self._failure_handlers.get(job.kind)
+        if on_failure is None:
+            return
+        try:
+            on_failure(job, error)
+        except Exception as e:
+            log.error("Error reporting failed job", job_id=job.id, error=e)
+
+
+job_worker = JobWorker()
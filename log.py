@@ -0,0 +1,252 @@
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import queue
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_EVERY, LOG_QUEUE_SIZE
+
+T = TypeVar("T")
+
+
+@dataclass
+class Span:
+    """One timed unit of work, e.g. a source refresh, inside a trace."""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    fields: Dict[str, Any] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+
+    def set(self, **fields: Any) -> None:
+        """Attach results to the span, e.g. a record count, logged when it finishes."""
+        self.fields.update(fields)
+
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("span", default=None)
+
+
+class _SpanFilter(logging.Filter):
+    """Stamp records with the calling thread's trace before they're queued."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        current = _current_span.get()
+        record.trace_id = current.trace_id if current else None
+        record.span_id = current.span_id if current else None
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hand records to the writer thread without ever blocking the caller."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback now, while the objects they refer to still exist
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    fields = dict(getattr(record, "fields", None) or {})
+    if getattr(record, "trace_id", None):
+        fields["trace"] = record.trace_id
+        fields["span"] = record.span_id
+    return fields
+
+
+class TextFormatter(logging.Formatter):
+    """2026-01-01 09:00:00 INFO refresh: Refreshed source source=EVP_NC_GOV seconds=3.2"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')} {record.levelname} {record.name}: {record.getMessage()}"
+        fields = " ".join(f"{key}={value}" for key, value in _fields(record).items())
+        if fields:
+            line = f"{line} {fields}"
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+_configured = False
+_configure_lock = threading.Lock()
+_queue_handler: Optional[_DroppingQueueHandler] = None
+
+
+def _configure() -> None:
+    """
+    Send every log record through a bounded queue to one writer thread, so
+    logging never blocks on stdout. Done once, on first use.
+    """
+    global _configured, _queue_handler
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+        _queue_handler = _DroppingQueueHandler(log_queue)
+        _queue_handler.addFilter(_SpanFilter())
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        root = logging.getLogger()
+        root.handlers = [_queue_handler]
+        root.setLevel(LOG_LEVEL)
+        listener.start()
+        # Write out whatever is still queued on a normal exit
+        atexit.register(listener.stop)
+
+
+def dropped_records() -> int:
+    """Records thrown away because the queue was full."""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+class Logger:
+    """
+    A module's logger. Extra keyword arguments are logged as structured fields:
+
+        log.info("Saved solicitations", source=source, count=len(batch))
+    """
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(name)
+        self._occurrences: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _log(self, level: int, message: str, fields: Dict[str, Any], exc_info: bool = False) -> None:
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, exc_info=exc_info, extra={"fields": fields}, stacklevel=3)
+
+    def debug(self, message: str, **fields: Any) -> None:
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message: str, **fields: Any) -> None:
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message: str, **fields: Any) -> None:
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message: str, **fields: Any) -> None:
+        self._log(logging.ERROR, message, fields)
+
+    def exception(self, message: str, **fields: Any) -> None:
+        """An error with the traceback of the exception being handled."""
+        self._log(logging.ERROR, message, fields, exc_info=True)
+
+    def sampled(self, level: int, message: str, every: int = LOG_SAMPLE_EVERY, **fields: Any) -> None:
+        """
+        For per-record events: log the first occurrence of message and then one
+        in every `every`, with the running count as the occurrences field.
+        """
+        if not self._logger.isEnabledFor(level):
+            return
+        with self._lock:
+            count = self._occurrences.get(message, 0) + 1
+            self._occurrences[message] = count
+        if count == 1 or count % every == 0:
+            self._log(level, message, {**fields, "occurrences": count})
+
+
+def get_logger(name: str) -> Logger:
+    _configure()
+    return Logger(name)
+
+
+_span_log = get_logger("span")
+
+
+def new_id(nbytes: int) -> str:
+    return secrets.token_hex(nbytes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **fields: Any) -> Iterator[Span]:
+    """
+    Time a unit of work. Spans opened inside it, in this thread or one started
+    with bind_context, share its trace id, so one refresh or delivery can be
+    followed across modules. Logs the span with its duration when it ends: at
+    INFO for a trace's root span, at DEBUG for the spans inside it.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent.trace_id if parent else new_id(8), new_id(4),
+                   parent.span_id if parent else None, dict(fields))
+    token = _current_span.set(current)
+    status = "ok"
+    try:
+        yield current
+    except BaseException as e:
+        status = "error"
+        current.fields["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration_ms = round((time.monotonic() - current.started) * 1000, 1)
+        extra = {"parent": current.parent_id} if current.parent_id else {}
+        level = logging.DEBUG if parent else logging.INFO
+        _span_log._log(level, name, {"duration_ms": duration_ms, "status": status, **current.fields, **extra})
+        _current_span.reset(token)
+
+
+def traced(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Run every call of the decorated function in its own span."""
+    def decorate(fn: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bind_context(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    Wrap fn to run in the caller's trace, for thread pools and threads, which
+    don't inherit it. Each call gets its own copy, so the wrapper can run in
+    several threads at once.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args: Any, **kwargs: Any) -> T:
+        return context.copy().run(fn, *args, **kwargs)
+    return run
@@ -1,15 +1,50 @@
+import threading
+
+from flask import Flask
+
 from env import ADMIN_EMAIL
 from routes import app
 from storage.db import setup_db, add_user
 from schedule import start_scheduler
+from refresh import start_refresher
+from jobs import job_worker
+from outbox import outbox_sender
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_background_workers() -> None:
+    """
+    Start the refresher, scheduler, job workers and outbox senders in this
+    process. Only the first call does anything.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+        start_refresher()
+        start_scheduler()
+        job_worker.start()
+        outbox_sender.start()
+
 
+def create_app(start_workers: bool = True) -> Flask:
+    """
+    Prepare the database and return the app, e.g. `gunicorn "main:create_app()"`,
+    which calls this once in each worker after forking.
+    :param start_workers: Also start the background threads; off for scripts that only need the app
+    """
+    setup_db()
+    add_user(ADMIN_EMAIL, is_admin=True)
+    if start_workers:
+        start_background_workers()
+    return app
 
-setup_db()
-add_user(ADMIN_EMAIL, is_admin=True)
-start_scheduler()
 
 if __name__ == "__main__":
     # Suppress SSL warnings for self-signed certs
     # import urllib3
     # urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    app.run(host="0.0.0.0", port=5002, debug=True)
+    create_app().run(host="0.0.0.0", port=5002, debug=True)
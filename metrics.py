@@ -0,0 +1,195 @@
+import atexit
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from log import get_logger
+from config import METRICS_FLUSH_SECONDS
+
+log = get_logger(__name__)
+
+# Seconds. Wide enough for a request at one end and a full source refresh at the other.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Every metric, by name, in the order they were defined
+_registry: Dict[str, "Metric"] = {}
+_lock = threading.Lock()
+_flusher_started = False
+
+
+def label_string(labels: Dict[str, Any]) -> str:
+    """Labels in the text exposition format, e.g. source="evp",status="ok"."""
+    return ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in sorted(labels.items()))
+
+
+def format_bucket(bound: float) -> str:
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+class Metric:
+    """
+    A named series per label set. Samples are kept in memory and added to the
+    shared metrics table every METRICS_FLUSH_SECONDS, so /metrics on any worker
+    reports the total across every process using the database.
+    """
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        # (labels, sample key) -> amount added since the last flush
+        self._pending: Dict[Tuple[str, str], float] = {}
+        with _lock:
+            if name in _registry:
+                raise ValueError(f"Metric {name} is already defined")
+            _registry[name] = self
+
+    def _add(self, labels: Dict[str, Any], key: str, amount: float) -> None:
+        sample = (label_string(labels), key)
+        with _lock:
+            self._pending[sample] = self._pending.get(sample, 0.0) + amount
+        _start_flusher()
+
+    def take_pending(self) -> Dict[Tuple[str, str], float]:
+        with _lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        self._add(labels, "", amount)
+
+
+class Gauge(Metric):
+    """A value that's set rather than added to; the most recent write from any process wins."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        sample = (label_string(labels), "")
+        with _lock:
+            self._pending[sample] = float(value)
+        _start_flusher()
+
+
+class Timer:
+    """Observe the time spent in a with block, or in each call of a decorated function."""
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+        self._start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.monotonic() - self._start, **self.labels)
+
+    def __call__(self, func: Callable) -> Callable:
+        def wrapper(*args: Any, **kwargs: Any):
+            # A fresh timer per call, so concurrent calls don't share a start time
+            with Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func  # type: ignore[attr-defined]
+        return wrapper
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        bound = next(b for b in self.buckets if value <= b)
+        key = label_string(labels)
+        with _lock:
+            for sample, amount in (((key, format_bucket(bound)), 1.0), ((key, "sum"), value), ((key, "count"), 1.0)):
+                self._pending[sample] = self._pending.get(sample, 0.0) + amount
+        _start_flusher()
+
+    def time(self, **labels: Any) -> Timer:
+        return Timer(self, labels)
+
+
+def flush() -> None:
+    """Write this process's samples since the last flush to the shared table."""
+    from storage.db import add_metric_samples
+
+    added: List[Tuple[str, str, str, str, float]] = []
+    gauges: List[Tuple[str, str, str, str, float]] = []
+    for metric in list(_registry.values()):
+        pending = metric.take_pending()
+        rows = gauges if metric.kind == "gauge" else added
+        rows.extend((metric.name, metric.kind, labels, key, value) for (labels, key), value in pending.items())
+    if added or gauges:
+        add_metric_samples(added, gauges)
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            log.error("Error flushing metrics", error=e)
+
+
+def _start_flusher() -> None:
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    threading.Thread(target=_flush_loop, daemon=True).start()
+    atexit.register(flush)
+
+
+def _sample_line(name: str, labels: str, value: float, extra: Optional[str] = None) -> str:
+    labels = ",".join(part for part in (labels, extra) if part)
+    return f"{name}{{{labels}}} {value:g}" if labels else f"{name} {value:g}"
+
+
+def render(rows: Iterable[Tuple[str, str, str, str, float]]) -> str:
+    """
+    Text exposition format (what Prometheus scrapes) for rows read back by
+    storage.db.get_metric_samples: (name, kind, labels, sample key, value).
+    """
+    by_metric: Dict[str, Dict[str, Dict[str, float]]] = {}
+    kinds: Dict[str, str] = {}
+    for name, kind, labels, key, value in rows:
+        kinds[name] = kind
+        by_metric.setdefault(name, {}).setdefault(labels, {})[key] = value
+
+    lines: List[str] = []
+    for name, series in by_metric.items():
+        metric = _registry.get(name)
+        if metric is not None:
+            lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {kinds[name]}")
+        for labels, samples in sorted(series.items()):
+            if kinds[name] != "histogram":
+                lines.append(_sample_line(name, labels, samples.get("", 0.0)))
+                continue
+            # Every bucket is listed, empty or not, so quantiles line up across scrapes
+            stored = {float(key) for key in samples if key not in ("sum", "count")}
+            declared = metric.buckets if isinstance(metric, Histogram) else ()
+            cumulative = 0.0
+            for bound in sorted(stored.union(declared, [math.inf])):
+                cumulative += samples.get(format_bucket(bound), 0.0)
+                lines.append(_sample_line(f"{name}_bucket", labels, cumulative, f'le="{format_bucket(bound)}"'))
+            lines.append(_sample_line(f"{name}_sum", labels, samples.get("sum", 0.0)))
+            lines.append(_sample_line(f"{name}_count", labels, samples.get("count", 0.0)))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,117 @@
+import threading
+from typing import Iterable, Optional
+
+from storage.db import enqueue_email, claim_emails, mark_email_sent, fail_email, save_digest
+from storage.models import OutboxEmail
+from data_sources.Solicitation import Solicitations
+from emailer import build_message, send_message, summary_subject
+from digest import render_budgeted_digest
+from jobs import worker_id
+from timing import StageTimer
+from log import get_logger
+from env import URI
+from config import OUTBOX_WORKERS, OUTBOX_BATCH_SIZE, OUTBOX_POLL_SECONDS, OUTBOX_MAX_ATTEMPTS
+from config import OUTBOX_RETRY_SECONDS, OUTBOX_LEASE_SECONDS
+
+log = get_logger(__name__)
+
+# Lower numbers are sent first
+LOGIN_PRIORITY = 0
+ALERT_PRIORITY = 1
+DIGEST_PRIORITY = 2
+
+
+class OutboxSender:
+    """
+    Send queued mail from the outbox table on OUTBOX_WORKERS threads.
+
+    Each thread claims up to OUTBOX_BATCH_SIZE messages of one priority and
+    sends them over pooled SMTP sessions. The first thread only sends login
+    links, so they never wait behind a batch of digests. Failed sends are
+    retried with exponential backoff up to OUTBOX_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self):
+        self._wake = threading.Event()
+
+    def notify(self) -> None:
+        """Wake idle senders in this process, e.g. right after queueing."""
+        self._wake.set()
+
+    def start(self, workers: int = OUTBOX_WORKERS) -> None:
+        log.info("Starting outbox senders", workers=workers)
+        for i in range(workers):
+            max_priority = LOGIN_PRIORITY if i == 0 and workers > 1 else None
+            threading.Thread(target=self._loop, args=(max_priority,), daemon=True).start()
+
+    def _loop(self, max_priority: Optional[int]) -> None:
+        while True:
+            try:
+                emails = claim_emails(worker_id(), OUTBOX_BATCH_SIZE, OUTBOX_LEASE_SECONDS, max_priority)
+            except Exception as e:
+                log.error("Error claiming outbox messages", error=e)
+                emails = []
+            if not emails:
+                self._wake.wait(OUTBOX_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            for email in emails:
+                self._send(email)
+
+    def _send(self, email: OutboxEmail) -> None:
+        owner = worker_id()
+        try:
+            send_message(email.to_address, email.message)
+        except Exception as e:
+            retry_delay = OUTBOX_RETRY_SECONDS * 2 ** (email.attempts - 1)
+            if fail_email(email.id, owner, str(e), retry_delay):
+                log.warning("Email failed, retrying", email_id=email.id, to=email.to_address,
+                            retry_seconds=retry_delay, error=e)
+            else:
+                log.error("Giving up on email", email_id=email.id, to=email.to_address,
+                          attempts=email.attempts, error=e)
+            return
+        mark_email_sent(email.id, owner)
+
+
+outbox_sender = OutboxSender()
+
+
+def queue_email(to_address: str, subject: str, body: str, priority: int = DIGEST_PRIORITY,
+                schedule_id: Optional[int] = None, seen: Optional[Iterable[bytes]] = None,
+                run_date: Optional[str] = None) -> int:
+    """
+    Queue a message for the outbox senders and return straight away.
+    :param seen: An only_new digest's new seen set, saved for schedule_id once the message is sent
+    :param run_date: The day of schedule_id's digest; if one was already queued for it, this one isn't
+    :return: Size of the message in bytes
+    """
+    message = build_message(to_address, subject, body)
+    enqueue_email(to_address, subject, message, priority, OUTBOX_MAX_ATTEMPTS, schedule_id, seen, run_date)
+    outbox_sender.notify()
+    return len(message.encode())
+
+
+def queue_summary_email(to_address: str, solicitations: Solicitations, user_id: int,
+                        timer: Optional[StageTimer] = None, schedule_id: Optional[int] = None,
+                        seen: Optional[Iterable[bytes]] = None, run_date: Optional[str] = None) -> int:
+    """
+    Queue a digest of solicitations, shortened to fit the digest budget with a
+    link to the full list if need be.
+    :param user_id: Owner of the full list, who alone can view it
+    :param timer: Records the "render" and "queue" stages if given
+    :param seen: See queue_email
+    :param run_date: See queue_email
+    :return: Size of the message in bytes
+    """
+    timer = timer or StageTimer()
+
+    def full_results_link() -> str:
+        digest_id = save_digest(user_id, [s.Id for s in solicitations])
+        return f"{URI}/digests/{digest_id}"
+
+    with timer.stage("render"):
+        subject = summary_subject()
+        body = render_budgeted_digest(solicitations, full_results_link)
+    with timer.stage("queue"):
+        return queue_email(to_address, subject, body, DIGEST_PRIORITY, schedule_id, seen, run_date)
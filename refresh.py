@@ -0,0 +1,202 @@
+import importlib
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from storage.db import get_source_state, mark_source_refreshed, acquire_lock, release_lock, is_locked
+from storage.db import record_refresh_run
+from jobs import LeaderLease, report_progress
+from metrics import Histogram, Gauge
+from log import get_logger, span
+from config import REFRESH_TTL_SECONDS, REFRESH_LOCK_TTL_SECONDS, REFRESH_INTERVALS, REFRESH_RETRY_SECONDS
+from config import LEADER_LEASE_SECONDS
+
+log = get_logger(__name__)
+
+# Each source's refresh function, which returns whether it succeeded, by the
+# module's SOURCE_NAME. Imported on first refresh, so web workers and scripts
+# that never refresh don't load the scrapers and their browser dependencies.
+SOURCES: Dict[str, str] = {
+    "EVP_NC_GOV": "data_sources.evp_nc_gov:save_evp_solicitations_to_db",
+    "TXSMARTBUY_ESBD": "data_sources.txsmartbuy_gov__esbd:save_txsmartbuy_solicitations_to_db",
+}
+
+SOURCE_FETCH_SECONDS = Histogram("source_fetch_seconds", "Time to fetch and store one source's solicitations")
+SOURCE_LAST_SUCCESS = Gauge("source_last_success_timestamp", "Unix time of each source's last successful refresh")
+
+# How often a caller waiting on another worker's refresh checks whether it finished
+POLL_SECONDS = 2.0
+
+# One lock per source, so callers in this process queue up behind a single refresh
+_local_locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in SOURCES}
+
+
+def refresh_function(source: str) -> Callable[[], bool]:
+    """Import a source's module, if it hasn't been yet, and return its refresh function."""
+    module_name, _, function_name = SOURCES[source].partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+@dataclass
+class SourceRefresh:
+    source: str
+    # "refreshed": this call fetched the data. "joined": another caller's refresh
+    # finished while we waited. "cached": the stored data was young enough to use.
+    # "failed": the refresh failed and the stored data is whatever was there before.
+    status: str
+    age_seconds: Optional[float]
+
+
+@dataclass
+class RefreshResult:
+    sources: List[SourceRefresh] = field(default_factory=list)
+
+    @property
+    def fresh(self) -> bool:
+        """Whether every source was fetched by this call or one it joined."""
+        return all(s.status in ("refreshed", "joined") for s in self.sources)
+
+    @property
+    def age_seconds(self) -> Optional[float]:
+        """Age of the oldest source's data, or None if a source has never refreshed."""
+        ages = [s.age_seconds for s in self.sources]
+        if not ages or any(age is None for age in ages):
+            return None
+        return max(age for age in ages if age is not None)
+
+    def describe(self) -> str:
+        age = self.age_seconds
+        age_text = "never refreshed" if age is None else f"{int(age // 60)} minutes old"
+        if any(s.status == "failed" for s in self.sources):
+            return f"Refresh failed for some sources; data is {age_text}"
+        return f"Using {'fresh' if self.fresh else 'cached'} data ({age_text})"
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _age(source: str) -> Optional[float]:
+    state = get_source_state(source)
+    if not state or state.last_success is None:
+        return None
+    return time.time() - state.last_success
+
+
+def _keep_lock_alive(name: str, owner: str, done: threading.Event) -> None:
+    """Extend a lock while a long refresh runs so it doesn't expire under us."""
+    while not done.wait(REFRESH_LOCK_TTL_SECONDS / 3):
+        acquire_lock(name, owner, REFRESH_LOCK_TTL_SECONDS)
+
+
+def refresh_source(source: str, max_age: float = REFRESH_TTL_SECONDS) -> SourceRefresh:
+    """
+    Make sure a source's stored solicitations are at most max_age seconds old.
+    Only one refresh per source runs at a time across every worker process;
+    anyone else asking meanwhile waits for it and shares the result.
+    """
+    age = _age(source)
+    if age is not None and age < max_age:
+        return SourceRefresh(source, "cached", age)
+
+    with _local_locks[source]:
+        # Another thread may have refreshed while we waited for the lock
+        age = _age(source)
+        if age is not None and age < max_age:
+            return SourceRefresh(source, "joined", age)
+
+        lock_name = f"refresh:{source}"
+        owner = _owner()
+        while not acquire_lock(lock_name, owner, REFRESH_LOCK_TTL_SECONDS):
+            # Another worker is refreshing; wait for it to finish
+            while is_locked(lock_name):
+                time.sleep(POLL_SECONDS)
+            age = _age(source)
+            if age is not None and age < max_age:
+                return SourceRefresh(source, "joined", age)
+
+        done = threading.Event()
+        threading.Thread(target=_keep_lock_alive, args=(lock_name, owner, done), daemon=True).start()
+        started = time.time()
+        error: Optional[str] = None
+        ok = False
+        try:
+            log.info("Refreshing source", source=source)
+            with span("refresh", source=source) as refresh:
+                ok = refresh_function(source)()
+                refresh.set(ok=ok)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            finished = time.time()
+            done.set()
+            if ok:
+                mark_source_refreshed(source, finished)
+                SOURCE_LAST_SUCCESS.set(finished, source=source)
+            SOURCE_FETCH_SECONDS.observe(finished - started, source=source, status="ok" if ok else "failed")
+            release_lock(lock_name, owner)
+            record_refresh_run(source, started, finished, "success" if ok else "failed", error)
+            log.info("Refreshed source", source=source, seconds=round(finished - started, 1),
+                     status="ok" if ok else "failed")
+
+        if ok:
+            return SourceRefresh(source, "refreshed", 0.0)
+        return SourceRefresh(source, "failed", _age(source))
+
+
+def refresh_all(max_age: float = REFRESH_TTL_SECONDS) -> RefreshResult:
+    """Refresh every source whose data is older than max_age seconds."""
+    result = RefreshResult()
+    for i, source in enumerate(SOURCES, 1):
+        report_progress(f"Refreshing {source} ({i} of {len(SOURCES)})")
+        try:
+            result.sources.append(refresh_source(source, max_age))
+        except Exception as e:
+            log.error("Error refreshing source", source=source, error=e)
+            result.sources.append(SourceRefresh(source, "failed", _age(source)))
+    log.info(result.describe())
+    report_progress(result.describe())
+    return result
+
+
+def current_status() -> RefreshResult:
+    """Report how old each source's stored data is without refreshing anything."""
+    return RefreshResult([SourceRefresh(source, "cached", _age(source)) for source in SOURCES])
+
+
+refresher_leader = LeaderLease("refresher-leader")
+
+
+def refresher_loop():
+    """
+    Keep every source refreshed on its own cadence from REFRESH_INTERVALS, so
+    deliveries only ever filter and email stored data. Only the process holding
+    the refresher lease does this; the rest stand by in case it dies.
+    """
+    due_at: Dict[str, float] = {source: 0.0 for source in SOURCES}
+    while True:
+        refresher_leader.wait_for_leadership()
+        for source in SOURCES:
+            if time.time() < due_at[source]:
+                continue
+            interval = REFRESH_INTERVALS.get(source, REFRESH_TTL_SECONDS)
+            try:
+                result = refresh_source(source, max_age=interval)
+            except Exception as e:
+                log.error("Error refreshing source", source=source, error=e)
+                result = SourceRefresh(source, "failed", _age(source))
+            if result.status == "failed" or result.age_seconds is None:
+                due_at[source] = time.time() + REFRESH_RETRY_SECONDS
+            else:
+                due_at[source] = time.time() + interval - result.age_seconds
+        time.sleep(max(1.0, min(min(due_at.values()) - time.time(), LEADER_LEASE_SECONDS / 3)))
+
+
+def start_refresher():
+    log.info("Starting background refresher")
+    refresher_thread = threading.Thread(target=refresher_loop, daemon=True)
+    refresher_thread.start()
@@ -1,50 +1,94 @@
-from typing import Dict
+import gzip
+import hashlib
+import json
+import time
+from dataclasses import fields as dataclass_fields
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from flask import Flask, request, redirect, render_template, session
+from flask import Flask, request, redirect, render_template, jsonify, g
 
 from storage import db
-from storage.models import User
+from storage.models import User, Schedule, Filter
 from storage.db import get_all_solicitations
 from storage.db import delete_schedule
 
-from emailer import send_email, send_summary_email
+from outbox import queue_email, queue_summary_email, LOGIN_PRIORITY
 from env import ADMIN_EMAIL, COOKIE_SECRET, URI
+from config import DIGEST_PAGE_SIZE, REFRESH_LOCK_TTL_SECONDS, API_PAGE_SIZE, API_MAX_PAGE_SIZE, API_GZIP_MIN_BYTES
+from config import PREVIEW_PAGE_SIZE, METRICS_TOKEN
 from data_sources.Solicitation import Solicitation, Solicitations
-from data_sources.evp_nc_gov import save_evp_solicitations_to_db
-from data_sources.txsmartbuy_gov__esbd import save_txsmartbuy_solicitations_to_db
+from refresh import refresh_all, current_status
+from storage.db import get_all_source_states, get_recent_refresh_runs, get_recent_job_runs, get_outbox_counts
+from timing import StageTimer, summarize, summarize_stages
+from jobs import job_worker, report_progress
+from filters import evaluate_filter, preview_matches
+from auth import login_required, admin_required, owner_required, owns, is_admin, log_in, log_out, get_user
+import metrics
+from metrics import Histogram, Gauge
+from log import get_logger, span
 
 
+log = get_logger(__name__)
+
+# Jobs started from the site
+RUN_JOB = "run"
+REFRESH_JOB = "refresh"
+
+# Rows read at a time while looking for a page of filter matches
+API_SCAN_BATCH = 500
+
+# Deliveries the admin console's percentiles are computed over
+ADMIN_STATS_RUNS = 500
+
+HTTP_SECONDS = Histogram("http_request_seconds", "Time to answer a request, by route")
+FILTER_SECONDS = Histogram("filter_seconds", "Time to run one user's filters over every stored solicitation")
+OUTBOX_EMAILS = Gauge("outbox_emails", "Messages in the outbox, by status")
+
 app = Flask(__name__)
 app.secret_key = COOKIE_SECRET
 
 
-def fetch_and_save_all_solicitations():
-    """
-    Fetch and save solicitations from all sources.
-    """
-    print("Fetching EVP solicitations...")
-    save_evp_solicitations_to_db()
-    print("Fetching Texas SmartBuy solicitations...")
-    save_txsmartbuy_solicitations_to_db()
+@app.before_request
+def start_request_timer():
+    g.request_started = time.monotonic()
+
+
+@app.after_request
+def record_request_time(response):
+    started = g.get("request_started")
+    if started is not None:
+        # The route pattern, not the path, so ids don't make a series each
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_SECONDS.observe(time.monotonic() - started, route=route, method=request.method,
+                             status=response.status_code)
+    return response
+
+
+@app.template_filter("timestamp")
+def format_timestamp(value: Optional[float]) -> str:
+    """Render a Unix timestamp in local time for the admin console."""
+    if value is None:
+        return "never"
+    return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S")
 
 
-def process_user_solicitations(user: User) -> Solicitations:
+def process_user_solicitations(user: User, timer: Optional[StageTimer] = None) -> Solicitations:
     """
     For a user, filter solicitations and optionally send email. Returns (filtered_solicitations, user_filters).
+    :param timer: Records the "load" and "filter" stages if given
     """
-    # print(f"Processing solicitations for user {user.email}")
-    all_solicitations = get_all_solicitations()
-    # print(f"Total solicitations in database: {len(all_solicitations)}")
-    user_filters = db.get_filters_for_user(user.id)
-    # print(f"User has {len(user_filters)} filters")
-    if user_filters:
-        filtered_solicitations = all_solicitations.filter(user_filters)
-        # print(
-        #     f"After filtering: {len(filtered_solicitations)} solicitations match")
-    else:
-        filtered_solicitations = all_solicitations
-        # print(
-        #     f"No filters applied, sending all {len(filtered_solicitations)} solicitations")
+    timer = timer or StageTimer()
+    with timer.stage("load"):
+        all_solicitations = get_all_solicitations()
+        user_filters = db.get_filters_for_user(user.id)
+    with timer.stage("filter"), FILTER_SECONDS.time(), span("filter", user_id=user.id) as filtering:
+        if user_filters:
+            filtered_solicitations = all_solicitations.filter(user_filters)
+        else:
+            filtered_solicitations = all_solicitations
+        filtering.set(filters=len(user_filters), corpus=len(all_solicitations), matches=len(filtered_solicitations))
+    timer.counts["corpus_size"] = len(all_solicitations)
     return filtered_solicitations
 
 
@@ -53,47 +97,63 @@ def healthcheck():
  return "ok", 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Metrics from every worker process, in the Prometheus text format."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Unauthorized", 401
+    counts = get_outbox_counts()
+    for status in ("queued", "sending", "sent", "failed"):
+        OUTBOX_EMAILS.set(counts.get(status, 0), status=status)
+    metrics.flush()
+    return metrics.render(db.get_metric_samples()), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
 @app.route("/", methods=["GET"])
-def default():
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-    return render_template("main.html", email=email, is_admin=email == ADMIN_EMAIL)
+@login_required
+def default(user: User):
+    return render_template("main.html", email=user.email, is_admin=is_admin(user))
 
 @app.route("/logout", methods=["POST"])
 def logout():
-    session.pop("email", None)
+    log_out()
     return redirect("/")
 
 @app.route("/admin", methods=["GET"])
-def admin_console():
-    email = session.get("email")
-    if not email or email != ADMIN_EMAIL:
-        return redirect("/login")
-
-    return render_template("admin.html", users=db.list_users(), email=email)
+@admin_required
+def admin_console(user: User):
+    job_runs = get_recent_job_runs(ADMIN_STATS_RUNS)
+    stage_stats = summarize_stages(run.stages for run in job_runs)
+    stage_stats["total"] = summarize([run.duration for run in job_runs if run.duration is not None])
+    user_durations: Dict[str, list] = {}
+    for run in job_runs:
+        if run.duration is not None:
+            user_durations.setdefault(run.user_email or f"user {run.user_id}", []).append(run.duration)
+    slowest_users = sorted(((name, summarize(durations)) for name, durations in user_durations.items()),
+                           key=lambda item: item[1]["p95"], reverse=True)[:5]
+    return render_template("admin.html", users=db.list_users(), email=user.email,
+                           sources=get_all_source_states(),
+                           refresh_runs=get_recent_refresh_runs(),
+                           job_runs=job_runs[:20],
+                           stage_stats=stage_stats,
+                           slowest_users=slowest_users,
+                           outbox=get_outbox_counts())
 
 
 @app.route("/admin/add-user", methods=["POST"])
-def add_user():
-    email = session.get("email")
-    if not email or email != ADMIN_EMAIL:
-        return "Unauthorized", 403
-
+@admin_required
+def add_user(user: User):
     new_email = request.form.get("email")
     if new_email:
         db.add_user(new_email, is_admin=False)
     return redirect("/admin")
 
 @app.route("/admin/impersonate", methods=["POST"])
-def impersonate_user():
-    email = session.get("email")
-    if not email or email != ADMIN_EMAIL:
-        return "Unauthorized", 403
-
+@admin_required
+def impersonate_user(user: User):
     impersonate_email = request.form.get("impersonate_email")
-    if impersonate_email and db.get_user(impersonate_email):
-        session["email"] = impersonate_email
+    if impersonate_email and get_user(impersonate_email):
+        log_in(impersonate_email)
     return redirect("/")
 
 
@@ -107,12 +167,12 @@ def send_magic_link():
     email = request.form.get("email")
     if not email:
         return render_template("base.html", error="Email required")
-    if not db.get_user(email) and not email == ADMIN_EMAIL:
+    if not get_user(email) and not email == ADMIN_EMAIL:
         return render_template("base.html", error="User not found. Please check your spelling or contact your admin.")
 
     token = db.generate_magic_token(email)
     link = f"{URI}/magic-login?token={token}"
-    send_email(email, "Solicitations Login Link", f"Click here to log in: {link}")
+    queue_email(email, "Solicitations Login Link", f"Click here to log in: {link}", LOGIN_PRIORITY)
     return render_template("base.html", error=f"Login link sent to {email}")
 
 
@@ -127,37 +187,26 @@ def magic_login():
     if not email:
         return "Invalid or expired token", 400
 
-    session["email"] = email
+    log_in(email)
     return redirect("/")
 
 
 @app.route("/schedules", methods=["GET"])
-def schedule():
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-    user = db.get_user(email)
-    if not user:
-        return redirect("/login")
+@login_required
+def schedule(user: User):
     schedules = db.get_schedules_for_user(user.id)
-    return render_template("schedules.html", schedules=schedules, email=email)
+    return render_template("schedules.html", schedules=schedules, email=user.email)
 
 
 @app.route("/schedules/<int:schedule_id>/edit", methods=["GET"])
-def schedule_edit(schedule_id: int):
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-    user = db.get_user(email)
-    if not user:
-        return "User not found", 404
-
+@login_required
+def schedule_edit(schedule_id: int, user: User):
     if schedule_id == 0:
         # schedule starts index from 1, so this is safe
         schedule = None
     else:
         schedule = db.get_schedule_by_id(schedule_id)
-        if not schedule or schedule.user_id != user.id:
+        if not schedule or not owns(user, schedule.user_id):
             return "Schedule not found or access denied", 404
 
     if schedule:
@@ -168,26 +217,22 @@ def schedule_edit(schedule_id: int):
         selected_days = [
             day for day in day_fields if getattr(schedule, day.lower())]
         times = {day: getattr(schedule, day.lower()) for day in selected_days}
+        only_new = schedule.only_new
     else:
         form_action = f"/schedules/create"
         name = ""
         selected_days = []
         times = {}
+        only_new = False
 
-    return render_template("schedule_edit.html", schedule=schedule, email=email,
+    return render_template("schedule_edit.html", schedule=schedule, email=user.email,
                            form_action=form_action, name=name,
-                           selected_days=selected_days, times=times)
+                           selected_days=selected_days, times=times, only_new=only_new)
 
 
 @app.route("/schedules/create", methods=["POST"])
-def schedule_create():
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-    user = db.get_user(email)
-    if not user:
-        return "User not found", 404
-
+@login_required
+def schedule_create(user: User):
     schedule_data: Dict[str, str] = {
         "name": request.form.get("name", "").strip() or "Default",
         "Monday": request.form.get("time_Monday", "") or "",
@@ -197,6 +242,7 @@ def schedule_create():
         "Friday": request.form.get("time_Friday", "") or "",
         "Saturday": request.form.get("time_Saturday", "") or "",
         "Sunday": request.form.get("time_Sunday", "") or "",
+        "only_new": "1" if request.form.get("only_new") else "0",
     }
 
     db.add_schedule(user.id, schedule_data)
@@ -204,18 +250,8 @@ def schedule_create():
 
 
 @app.route("/schedules/<int:schedule_id>/save", methods=["POST"])
-def schedule_save(schedule_id: int):
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-    user = db.get_user(email)
-    if not user:
-        return "User not found", 404
-
-    schedule = db.get_schedule_by_id(schedule_id)
-    if not schedule or schedule.user_id != user.id:
-        return "Schedule not found or access denied", 404
-
+@owner_required("schedule", db.get_schedule_by_id, "Schedule not found or access denied")
+def schedule_save(schedule_id: int, schedule: Schedule, user: User):
     updated_data: Dict[str, str] = {
         "name": request.form.get("name", "").strip() or "Default",
         "Monday": request.form.get("time_Monday", "") or "",
@@ -225,6 +261,7 @@ def schedule_save(schedule_id: int):
         "Friday": request.form.get("time_Friday", "") or "",
         "Saturday": request.form.get("time_Saturday", "") or "",
         "Sunday": request.form.get("time_Sunday", "") or "",
+        "only_new": "1" if request.form.get("only_new") else "0",
     }
 
     db.update_schedule(schedule_id, updated_data)
@@ -232,69 +269,104 @@ def schedule_save(schedule_id: int):
 
 
 @app.route("/schedules/<int:schedule_id>/delete", methods=["POST"])
-def schedule_delete(schedule_id: int):
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-    user = db.get_user(email)
+@owner_required("schedule", db.get_schedule_by_id, "Schedule not found or access denied")
+def schedule_delete(schedule_id: int, schedule: Schedule, user: User):
+    delete_schedule(schedule_id)
+    return redirect("/schedules")
+
+
+# Background jobs started from the site
+def job_started(job_id: Optional[int], redirect_to: str):
+    """
+    Answer a request that queued a job: 202 with the job id for scripts, or a
+    redirect for a plain form post, where the page then polls /jobs/<id>.
+    """
+    if job_id is None:
+        return "Could not start job", 500
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+    return redirect(f"{redirect_to}?job={job_id}")
+
+
+def run_user_digest(payload: Dict[str, int]) -> None:
+    """Job handler behind /run: filter stored solicitations for a user and email them."""
+    user = db.get_user_by_id(payload["user_id"])
     if not user:
-        return redirect("/login")
+        return
+    # The background refresher keeps the table warm, so only filter and email here
+    report_progress("Filtering solicitations")
+    filtered_solicitations = process_user_solicitations(user)
+    report_progress(f"Emailing {len(filtered_solicitations)} solicitations")
+    queue_summary_email(user.email, filtered_solicitations, user.id)
+    report_progress(f"Emailed {len(filtered_solicitations)} solicitations. {current_status().describe()}")
 
-    schedule = db.get_schedule_by_id(schedule_id)
-    if not schedule or schedule.user_id != user.id:
-        return "Schedule not found or access denied", 404
 
-    delete_schedule(schedule_id)
-    return redirect("/schedules")
+def refresh_all_sources(payload: Dict[str, int]) -> None:
+    """Job handler behind /filters/fetch."""
+    refresh_all()
+
+
+job_worker.register(RUN_JOB, run_user_digest)
+# A refresh can wait on another worker's scrape, which renews its lock for as long as it runs
+job_worker.register(REFRESH_JOB, refresh_all_sources, timeout=REFRESH_LOCK_TTL_SECONDS)
 
 
 # Route to trigger the "run now" functionality for the logged-in user
 @app.route("/run", methods=["POST"])
-def run_scraper():
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
+@login_required
+def run_scraper(user: User):
+    job_id = db.enqueue_job(RUN_JOB, {"user_id": user.id}, max_attempts=1)
+    job_worker.notify()
+    return job_started(job_id, "/")
+
+
+@app.route("/jobs/<int:job_id>", methods=["GET"])
+@login_required(api=True)
+def job_status(job_id: int, user: User):
+    """Current stage of a job started from the site, polled by the page that started it."""
+    job = db.get_job(job_id)
+    # A refresh is shared by everyone who asked for it while it was running
+    shared = job is not None and job.kind == REFRESH_JOB
+    if not job or not (shared or owns(user, json.loads(job.payload).get("user_id"), admin_allowed=True)):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.last_error if job.status == "failed" else None,
+    })
+
+
+@app.route("/digests/<digest_id>", methods=["GET"])
+@login_required
+def digest_view(digest_id: str, user: User):
+    """Page through the full result set behind a digest email that was cut short."""
+    digest = db.get_digest(digest_id)
+    if not digest or not owns(user, digest.user_id, admin_allowed=True):
+        return "Digest not found or expired", 404
+
+    pages = max(1, -(-len(digest.solicitation_ids) // DIGEST_PAGE_SIZE))
+    page = min(max(request.args.get("page", 1, type=int), 1), pages)
+    page_ids = digest.solicitation_ids[(page - 1) * DIGEST_PAGE_SIZE:page * DIGEST_PAGE_SIZE]
+    return render_template("digest_view.html", email=user.email, digest=digest,
+                           matches=db.get_solicitations_by_ids(page_ids),
+                           total=len(digest.solicitation_ids), page=page, pages=pages)
 
-    try:
-        user = db.get_user(email)
-        if not user:
-            return redirect("/login")
-        fetch_and_save_all_solicitations()
-        filtered_solicitations = process_user_solicitations(
-            user)
-        send_summary_email(user.email, filtered_solicitations)
-        return redirect("/")
-    except Exception as e:
-        print(f"Error running scraper for {email}: {e}")
-        return "Error running scraper", 500
 
 # Filter management routes
 
 
 @app.route("/filters", methods=["GET"])
-def filters():
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-
-    user = db.get_user(email)
-    if not user:
-        return redirect("/login")
-
+@login_required
+def filters(user: User):
     user_filters = db.get_filters_for_user(user.id)
-    return render_template("filters.html", filters=user_filters, email=email, fields=Solicitation.get_filterable_fields())
+    return render_template("filters.html", filters=user_filters, email=user.email, fields=Solicitation.get_filterable_fields())
 
 
 @app.route("/filters/create", methods=["POST"])
-def create_filter():
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-
-    user = db.get_user(email)
-    if not user:
-        return redirect("/login")
-
+@login_required
+def create_filter(user: User):
     filter_id = request.form.get("filter_id")
     name = request.form.get("name")
     criteria = request.form.get("criteria")
@@ -303,65 +375,170 @@ def create_filter():
         return "Missing name or criteria", 400
 
     if filter_id:
-        db.update_filter(int(filter_id), name, criteria)
+        filter = db.get_filter_by_id(int(filter_id))
+        if not filter or not owns(user, filter.user_id):
+            return "Filter not found or access denied", 404
+        db.update_filter(filter.id, name, criteria)
     else:
         db.add_filter(user.id, name, criteria)
     return redirect("/filters")
 
 
 @app.route("/filters/<int:filter_id>/delete", methods=["POST"])
-def delete_filter(filter_id: int):
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-
-    user = db.get_user(email)
-    if not user:
-        return redirect("/login")
-
-    filter = db.get_filter_by_id(filter_id)
-    if not filter or filter.user_id != user.id:
-        return "Filter not found or access denied", 404
-
+@owner_required("filter", db.get_filter_by_id, "Filter not found or access denied")
+def delete_filter(filter_id: int, filter: Filter, user: User):
     db.delete_filter(filter_id)
     return redirect("/filters")
 
 
 @app.route("/filters/fetch", methods=["POST"])
-def fetch_data_for_filters():
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
-
+@login_required
+def fetch_data_for_filters(user: User):
+    # Everyone who asks while a refresh is queued or running shares it, so clicks
+    # can't fill the job workers with refreshes waiting on the same scrape
+    job_id = db.enqueue_shared_job(REFRESH_JOB, {"user_id": user.id}, dedupe_key=REFRESH_JOB, max_attempts=1)
+    job_worker.notify()
+    return job_started(job_id, "/filters")
+
+
+@app.route("/filters/preview", methods=["POST"])
+@login_required(api=True)
+def preview_filter(user: User):
+    """
+    Live preview for the filter editor: the match count and one page of matches
+    for the unsaved criteria posted as {"criteria": {...}, "page": 1}.
+    """
+    body = request.get_json(silent=True) or {}
+    criteria = body.get("criteria")
+    if not isinstance(criteria, dict):
+        return jsonify({"error": "criteria must be a JSON object"}), 400
     try:
-        user = db.get_user(email)
-        if not user:
-            return redirect("/login")
-        fetch_and_save_all_solicitations()
-        process_user_solicitations(user)
-        return redirect("/filters")
-    except Exception as e:
-        print(f"Error fetching data for {email}: {e}")
-        return "Error fetching data", 500
+        requested_page = int(body.get("page") or 1)
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({"error": "page must be a number"}), 400
+    try:
+        matches = preview_matches(criteria)
+    except (AttributeError, KeyError, TypeError) as e:
+        return jsonify({"error": f"Invalid criteria: {e}"}), 400
 
+    pages = max(1, -(-len(matches) // PREVIEW_PAGE_SIZE))
+    page = min(max(requested_page, 1), pages)
+    page_matches = Solicitations(matches[(page - 1) * PREVIEW_PAGE_SIZE:page * PREVIEW_PAGE_SIZE])
+    return jsonify({"count": len(matches), "page": page, "pages": pages, "html": page_matches.to_html()})
 
-@app.route("/filters/test", methods=["POST"])
-def test_filters():
-    email = session.get("email")
-    if not email:
-        return redirect("/login")
 
+@app.route("/filters/test", methods=["POST"])
+@login_required
+def test_filters(user: User):
     try:
-        user = db.get_user(email)
-        if not user:
-            return redirect("/login")
         user_filters = db.get_filters_for_user(user.id)
         filtered_solicitations = process_user_solicitations(user)
         return render_template("filters.html",
                                filters=user_filters,
-                               email=email,
+                               email=user.email,
                                fields=Solicitation.get_filterable_fields(),
                                matches=filtered_solicitations)
-    except Exception as e:
-        print(f"Error testing filters for {email}: {e}")
+    except Exception:
+        log.exception("Error testing filters", user=user.email)
         return "Error testing filters", 500
+
+
+# JSON API. Pages are keyset-paginated over solicitation row ids, so a page
+# costs the same however deep it is; pass next_cursor back as ?cursor=.
+API_FIELDS = [f.name for f in dataclass_fields(Solicitation)]
+
+
+def api_page_params() -> Tuple[int, int, List[str]]:
+    """:return: The cursor, page size and projected fields requested"""
+    cursor = max(request.args.get("cursor", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    requested = [f for f in request.args.get("fields", "").split(",") if f]
+    return cursor, limit, [f for f in requested if f in API_FIELDS] or API_FIELDS
+
+
+def api_etag(etag_parts: List[object]) -> str:
+    """ETag for a page, from everything that decides its contents."""
+    return hashlib.sha1(json.dumps(etag_parts, sort_keys=True).encode()).hexdigest()
+
+
+def not_modified(etag: str):
+    """
+    A 304 if the client's ETag still matches, else None. Checked before any
+    rows are read, so a repeat poll costs no scan.
+    """
+    if not request.if_none_match.contains(etag):
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def api_response(payload: Dict[str, object], etag: str):
+    """JSON response, gzipped when the client accepts it and it's worth it."""
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) >= API_GZIP_MIN_BYTES and request.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def project(solicitation: Solicitation, names: List[str]) -> Dict[str, object]:
+    return {name: getattr(solicitation, name) for name in names}
+
+
+@app.route("/api/solicitations", methods=["GET"])
+@login_required(api=True)
+def api_solicitations(user: User):
+    """Stored solicitations. Query: cursor, limit, fields (comma separated)."""
+    cursor, limit, names = api_page_params()
+    etag = api_etag(["solicitations", db.get_corpus_generation(), cursor, limit, names])
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        return unchanged
+    rows = db.get_solicitations_after(cursor, limit)
+    return api_response({
+        "items": [project(s, names) for _, s in rows],
+        "next_cursor": rows[-1][0] if len(rows) == limit else None,
+    }, etag)
+
+
+@app.route("/api/matches", methods=["GET"])
+@login_required(api=True)
+def api_matches(user: User):
+    """
+    Solicitations matching the user's filters, or just one with ?filter_id=.
+    Query: cursor, limit, fields (comma separated). Each page only evaluates
+    filters as far as the rows it needs.
+    """
+    cursor, limit, names = api_page_params()
+    user_filters = db.get_filters_for_user(user.id)
+    filter_id = request.args.get("filter_id", type=int)
+    if filter_id is not None:
+        user_filters = [f for f in user_filters if f.id == filter_id]
+        if not user_filters:
+            return jsonify({"error": "Filter not found"}), 404
+    etag = api_etag(["matches", db.get_corpus_generation(), cursor, limit, names,
+                      [f.criteria for f in user_filters]])
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        return unchanged
+    criteria = [json.loads(f.criteria) for f in user_filters]
+
+    items: List[Dict[str, object]] = []
+    next_cursor: Optional[int] = cursor
+    while len(items) < limit and next_cursor is not None:
+        rows = db.get_solicitations_after(next_cursor, API_SCAN_BATCH)
+        if not rows:
+            next_cursor = None
+            break
+        for row_id, solicitation in rows:
+            next_cursor = row_id
+            if not criteria or any(evaluate_filter(c, solicitation) for c in criteria):
+                items.append(project(solicitation, names))
+                if len(items) == limit:
+                    break
+    return api_response({"items": items, "next_cursor": next_cursor}, etag)
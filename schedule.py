@@ -1,69 +1,210 @@
+import heapq
+import json
 import threading
 import time
-from datetime import datetime, time as dt_time
-from typing import Any
-from storage.db import has_run_today, mark_as_run, get_all_schedules, get_user_by_id
-# Import the centralized job function
-from routes import fetch_and_save_all_solicitations, process_user_solicitations
-from emailer import send_summary_email, send_email
+from datetime import datetime, timedelta, time as dt_time
+from typing import Any, Dict, List, Optional, Tuple
+from storage.db import has_run_today, record_job_run, get_all_schedules, get_user_by_id, get_schedule_by_id
+from storage.db import get_last_run_dates, add_schedule_listener, enqueue_job, get_seen_hashes, SEEN_HASH_BYTES
+from storage.models import Schedule, Job, JobRun
+from routes import process_user_solicitations
+from data_sources.Solicitation import Solicitations
+from digest import content_key
+from outbox import queue_summary_email, queue_email, ALERT_PRIORITY
+from jobs import LeaderLease, job_worker, check_lease
+from timing import StageTimer
+from log import get_logger, span
 from env import ADMIN_EMAIL
+from config import SCHEDULER_MAX_SLEEP_SECONDS, LEADER_LEASE_SECONDS
 
-def should_run(schedule_time_str: str) -> bool:
-    now = datetime.now()
+log = get_logger(__name__)
+
+DELIVERY_JOB = "delivery"
+
+WEEKDAY_FIELDS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def parse_schedule_time(schedule_time_str: str) -> Optional[dt_time]:
     try:
-        target_time = dt_time.fromisoformat(schedule_time_str)
-        scheduled_datetime = datetime.combine(now.date(), target_time)
-        print(f"Checking if should run {now} at {scheduled_datetime} for schedule time {schedule_time_str} from {target_time}")
-        return now >= scheduled_datetime
+        return dt_time.fromisoformat(schedule_time_str)
     except ValueError:
-        print("Exception parsing time:", schedule_time_str)
-        return False
+        log.warning("Error parsing schedule time", value=schedule_time_str)
+        return None
+
+
+def next_fire_time(schedule: Schedule, now: datetime, last_run_date: Optional[str]) -> Optional[datetime]:
+    """
+    When a schedule should next run. A time already passed today still fires
+    right away if the schedule hasn't run today, as with the old polling loop.
+    :return: None if the schedule has no valid times
+    """
+    for offset in range(8):
+        day = now.date() + timedelta(days=offset)
+        schedule_time_str = getattr(schedule, WEEKDAY_FIELDS[day.weekday()])
+        if not schedule_time_str:
+            continue
+        if last_run_date == day.strftime("%Y-%m-%d"):
+            continue
+        target_time = parse_schedule_time(schedule_time_str)
+        if target_time is None:
+            continue
+        return max(now, datetime.combine(day, target_time))
+    return None
+
+
+def only_new(schedule_id: int, matches: Solicitations) -> Tuple[Solicitations, List[bytes]]:
+    """
+    Drop matches the schedule already delivered unchanged.
+    :return: The new or changed matches, and the seen set to save once they're delivered
+    """
+    seen = get_seen_hashes(schedule_id)
+    hashes = [bytes.fromhex(content_key(s))[:SEEN_HASH_BYTES] for s in matches]
+    fresh = Solicitations(s for s, h in zip(matches, hashes) if h not in seen)
+    # Everything currently matching has now been delivered at some point, and
+    # anything no longer matching drops out, so the set stays the size of one digest
+    return fresh, hashes
+
+
+def deliver_schedule(payload: Dict[str, Any]) -> None:
+    """
+    Job handler that filters and emails one schedule's digest. Raises on failure
+    so the job queue retries it.
+    """
+    schedule_id, date_str = payload["schedule_id"], payload["date"]
+    schedule = get_schedule_by_id(schedule_id)
+    # Deleted since it was queued, or delivered by an earlier attempt
+    if schedule is None or has_run_today(schedule_id, date_str):
+        return
+    user = get_user_by_id(schedule.user_id)
+    if user is None:
+        return
+    today_field = WEEKDAY_FIELDS[datetime.strptime(date_str, "%Y-%m-%d").weekday()]
+    log.info("Running scheduled delivery", schedule_id=schedule_id, user=user.email,
+             day=today_field, time=getattr(schedule, today_field))
+    timer = StageTimer()
+    run = JobRun(schedule_id, date_str, user_id=user.id, started_at=timer.started_at)
+    seen: Optional[List[bytes]] = None
+    try:
+        with span("delivery", schedule_id=schedule_id, user_id=user.id) as delivery:
+            filtered_solicitations = process_user_solicitations(user, timer)
+            if schedule.only_new:
+                with timer.stage("dedupe"):
+                    filtered_solicitations, seen = only_new(schedule_id, filtered_solicitations)
+            run.match_count = len(filtered_solicitations)
+            # Past JOB_TIMEOUT_SECONDS the admin has been told this delivery failed, and
+            # the job may be retried, so don't send the digest after all
+            check_lease()
+            # The seen set only advances once the outbox has sent the digest. If this run
+            # isn't recorded below, the retry's digest is dropped as a duplicate of this one.
+            run.email_bytes = queue_summary_email(user.email, filtered_solicitations, user.id, timer,
+                                                  schedule_id, seen, date_str)
+            delivery.set(matches=run.match_count, email_bytes=run.email_bytes)
+    except Exception as e:
+        run.status, run.error = "failed", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        run.finished_at = time.time()
+        run.stages = timer.stages
+        run.corpus_size = timer.counts.get("corpus_size")
+        record_job_run(run)
+    log.info("Delivered schedule", schedule_id=schedule_id, seconds=round(run.duration, 1),
+             **{f"{name}_seconds": round(seconds, 2) for name, seconds in timer.stages.items()})
+
+
+def report_delivery_failure(job: Job, error: str) -> None:
+    """Email the admin about a digest that ran out of attempts."""
+    schedule_id = json.loads(job.payload)["schedule_id"]
+    message = f"Error running scheduled job {schedule_id} after {job.attempts} attempts: {error}"
+    log.error("Scheduled delivery failed", schedule_id=schedule_id, attempts=job.attempts, error=error)
+    queue_email(ADMIN_EMAIL, "Error running scheduled job", message, ALERT_PRIORITY)
 
-def scheduler_loop():
-    # print("Scheduler loop started")
-    weekday_fields = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
 
-    while True:
+class Scheduler:
+    """
+    Keep every schedule's next fire time in a heap and sleep until the earliest,
+    then queue a delivery job for each due schedule.
+
+    Every process runs one, but only the holder of the leader lease queues
+    work. Schedule changes wake the loop so it reloads straight away. It also
+    reloads at least every SCHEDULER_MAX_SLEEP_SECONDS to pick up changes made
+    by other processes.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int]] = []
+        self._schedules: Dict[int, Schedule] = {}
+        self._changed = threading.Event()
+        self.leader = LeaderLease("scheduler-leader")
+
+    def notify_changed(self) -> None:
+        self._changed.set()
+
+    def _load(self) -> None:
+        now = datetime.now()
+        last_runs = get_last_run_dates()
+        self._schedules = {schedule.id: schedule for schedule in get_all_schedules()}
+        self._heap = []
+        for schedule in self._schedules.values():
+            fire_at = next_fire_time(schedule, now, last_runs.get(schedule.id))
+            if fire_at is not None:
+                self._heap.append((fire_at, schedule.id))
+        heapq.heapify(self._heap)
+        if self._heap:
+            log.info("Next scheduled delivery", at=self._heap[0][0])
+
+    def _enqueue_due(self) -> None:
         now = datetime.now()
-        today_index = now.weekday()  # 0 = Monday, ..., 6 = Sunday
-        today_field = weekday_fields[today_index]
         date_str = now.strftime("%Y-%m-%d")
+        queued = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, schedule_id = heapq.heappop(self._heap)
+            schedule = self._schedules[schedule_id]
+            # The dedupe key stops a new leader re-queueing a digest its predecessor queued
+            if not has_run_today(schedule_id, date_str) and enqueue_job(
+                    DELIVERY_JOB, {"schedule_id": schedule_id, "date": date_str},
+                    dedupe_key=f"{DELIVERY_JOB}:{schedule_id}:{date_str}") is not None:
+                queued += 1
+            # Retries are up to the job queue from here
+            fire_at = next_fire_time(schedule, now, date_str)
+            if fire_at is not None:
+                heapq.heappush(self._heap, (fire_at, schedule_id))
+        if queued:
+            log.info("Queued scheduled deliveries", count=queued)
+            job_worker.notify()
 
-        schedules: list[Any] = get_all_schedules()
-        # Find all schedules that are due to run
-        due_schedules: list[Any] = []
-        for schedule in schedules:
-            schedule_time = getattr(schedule, today_field)
-            if not schedule_time:
-                continue
-            if has_run_today(schedule.id, date_str):
+    def run(self) -> None:
+        last_load = datetime.now()
+        while True:
+            if not self.leader.is_leader:
+                self.leader.wait_for_leadership()
+                self._load()
+                last_load = datetime.now()
+            # Wake often enough to notice losing the lease before acting on it
+            sleep_for = float(min(SCHEDULER_MAX_SLEEP_SECONDS, LEADER_LEASE_SECONDS / 3))
+            if self._heap:
+                sleep_for = min(sleep_for, (self._heap[0][0] - datetime.now()).total_seconds())
+            if self._changed.wait(timeout=max(0.0, sleep_for)):
+                self._changed.clear()
+                self._load()
+                last_load = datetime.now()
                 continue
-            if should_run(schedule_time):
-                due_schedules.append(schedule)
-
-        if due_schedules:
-            fetch_and_save_all_solicitations()
-            for schedule in due_schedules:
-                user = get_user_by_id(schedule.user_id)
-                if user is None:
-                    continue
-                print(
-                    f"Running scheduled job for user {user.email} on {today_field} at {getattr(schedule, today_field)}")
-                try:
-                    filtered_solicitations = process_user_solicitations(user)
-                    send_summary_email(user.email, filtered_solicitations)
-                    mark_as_run(schedule.id, date_str)
-                except Exception as e:
-                    print(
-                        f"Error running scheduled job for user {user.email}: {e}")
-                    send_email(ADMIN_EMAIL, "Error running scheduled job",
-                               f"Error running scheduled job for user {user.email} with {schedule.id}: {e}")
-        else:
-            print("No schedules due to run at this time.")
-
-        time.sleep(60)
+            if self.leader.is_leader:
+                self._enqueue_due()
+            if (datetime.now() - last_load).total_seconds() >= SCHEDULER_MAX_SLEEP_SECONDS:
+                self._load()
+                last_load = datetime.now()
+
+
+scheduler = Scheduler()
+
+
+def scheduler_loop():
+    scheduler.run()
+
 
 def start_scheduler():
-    print("Starting scheduler...")
+    log.info("Starting scheduler")
+    job_worker.register(DELIVERY_JOB, deliver_schedule, on_failure=report_delivery_failure)
+    add_schedule_listener(scheduler.notify_changed)
     scheduler_thread = threading.Thread(target=scheduler_loop, daemon=True)
     scheduler_thread.start()
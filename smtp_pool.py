@@ -0,0 +1,108 @@
+import atexit
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from env import SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD
+from config import SMTP_TIMEOUT_SECONDS, SMTP_POOL_SIZE, SMTP_MAX_MESSAGES_PER_CONNECTION, SMTP_IDLE_SECONDS
+
+
+@dataclass
+class PooledConnection:
+    server: smtplib.SMTP
+    sent: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+def connect() -> PooledConnection:
+    """Open an SMTP session, upgrade it to TLS and log in."""
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+    try:
+        server.starttls()
+        server.login(SMTP_USERNAME, SMTP_PASSWORD)
+    except BaseException:
+        close(PooledConnection(server))
+        raise
+    return PooledConnection(server)
+
+
+def close(entry: PooledConnection) -> None:
+    try:
+        entry.server.quit()
+    except Exception:
+        # Already dropped by the server; just release the socket
+        entry.server.close()
+
+
+def is_healthy(entry: PooledConnection) -> bool:
+    """Check an idle session is still open before reusing it."""
+    if time.monotonic() - entry.last_used > SMTP_IDLE_SECONDS:
+        return False
+    try:
+        return entry.server.noop()[0] == 250
+    except Exception:
+        return False
+
+
+class SMTPPool:
+    """
+    Keep logged-in SMTP sessions open so a batch of emails pays for one TLS
+    handshake and login per session instead of one per message.
+
+    Sessions are leased with `with pool.connection() as server:`. At most
+    SMTP_POOL_SIZE are open at once. A session is closed after
+    SMTP_MAX_MESSAGES_PER_CONNECTION messages, after sitting idle for
+    SMTP_IDLE_SECONDS (servers drop idle sessions), when it fails a NOOP, or
+    when the lease raised.
+    """
+
+    def __init__(self, size: int = SMTP_POOL_SIZE,
+                 max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION):
+        self.max_messages = max_messages
+        self._idle: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _checkout(self) -> PooledConnection:
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                return connect()
+            if is_healthy(entry):
+                return entry
+            close(entry)
+
+    def _checkin(self, entry: PooledConnection) -> None:
+        entry.sent += 1
+        entry.last_used = time.monotonic()
+        if entry.sent >= self.max_messages:
+            close(entry)
+            return
+        self._idle.put(entry)
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """Borrow a logged-in session for one message, blocking while every session is in use."""
+        with self._slots:
+            entry = self._checkout()
+            try:
+                yield entry.server
+            except BaseException:
+                close(entry)
+                raise
+            self._checkin(entry)
+
+    def shutdown(self) -> None:
+        while True:
+            try:
+                close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+smtp_pool = SMTPPool()
+atexit.register(smtp_pool.shutdown)
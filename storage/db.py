@@ -1,20 +1,35 @@
 # Filter model
 import sqlite3
 import os
-from typing import Dict, List, Optional
+import json
+from dataclasses import asdict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 import secrets
 import time
+import zlib
 
 from env import MAGIC_LINK_EXPIRY_SECONDS
+from config import JOB_MAX_ATTEMPTS, JOB_RETENTION_DAYS, DIGEST_RETENTION_DAYS, OUTBOX_RETENTION_DAYS
 
-from .models import User, Schedule, Filter
+from .models import User, Schedule, Filter, SourceState, RefreshRun, Job, JobRun, OutboxEmail, Digest
 
-from data_sources.Solicitation import Solicitations
+from data_sources.Solicitation import Solicitation, Solicitations
+from metrics import Histogram
+from log import get_logger, traced
+
+log = get_logger(__name__)
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(__file__), 'solicitations.db')
 
 
+def add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> None:
+    """Add a column to a table created by an older version of setup_db."""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
 # Persistent storage using SQLite
 def setup_db():
     with sqlite3.connect(DB_PATH) as conn:
@@ -58,6 +73,15 @@ def setup_db():
                 FOREIGN KEY(user_id) REFERENCES users(id)
             )
         ''')
+        add_column_if_missing(cursor, 'schedules', 'only_new', 'INTEGER NOT NULL DEFAULT 0')
+        # Hashes of what each schedule last matched, for only_new delivery
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schedule_seen (
+                schedule_id INTEGER PRIMARY KEY,
+                hashes BLOB NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS job_runs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -65,8 +89,125 @@ def setup_db():
                 run_date TEXT NOT NULL
             )
         ''')
+        # Per-run timings; rows from before these existed only have schedule_id and run_date
+        add_column_if_missing(cursor, 'job_runs', 'user_id', 'INTEGER')
+        add_column_if_missing(cursor, 'job_runs', 'started_at', 'REAL')
+        add_column_if_missing(cursor, 'job_runs', 'finished_at', 'REAL')
+        add_column_if_missing(cursor, 'job_runs', 'status', 'TEXT')
+        add_column_if_missing(cursor, 'job_runs', 'stages', 'TEXT')
+        add_column_if_missing(cursor, 'job_runs', 'corpus_size', 'INTEGER')
+        add_column_if_missing(cursor, 'job_runs', 'match_count', 'INTEGER')
+        add_column_if_missing(cursor, 'job_runs', 'email_bytes', 'INTEGER')
+        add_column_if_missing(cursor, 'job_runs', 'error', 'TEXT')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS source_state (
+                source TEXT PRIMARY KEY,
+                watermark TEXT,
+                last_full_sync TEXT
+            )
+        ''')
+        add_column_if_missing(cursor, 'source_state', 'last_success', 'REAL')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS refresh_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                record_count INTEGER,
+                error TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedupe_key TEXT UNIQUE,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                run_after REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                last_error TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, run_after)')
+        add_column_if_missing(cursor, 'jobs', 'progress', 'TEXT')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                to_address TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                message TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                run_after REAL NOT NULL,
+                created_at REAL NOT NULL,
+                sent_at REAL,
+                last_error TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, priority, run_after)')
+        # An only_new digest's seen set, saved to schedule_seen once the digest is sent
+        add_column_if_missing(cursor, 'outbox', 'schedule_id', 'INTEGER')
+        add_column_if_missing(cursor, 'outbox', 'seen_hashes', 'BLOB')
+        # One digest per schedule and day, even if its job is retried after queueing it
+        add_column_if_missing(cursor, 'outbox', 'run_date', 'TEXT')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS outbox_delivery ON outbox (schedule_id, run_date)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS digests (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                solicitation_ids TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS deferred_solicitations (
+                source TEXT NOT NULL,
+                solicitation_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                last_error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (source, solicitation_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metrics (
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                sample TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (name, labels, sample)
+            )
+        ''')
         conn.commit()
 
+# Called with a user's email whenever it's added or changed, e.g. to drop cached copies
+_user_listeners: List[Callable[[str], None]] = []
+
+
+def add_user_listener(listener: Callable[[str], None]) -> None:
+    _user_listeners.append(listener)
+
+
 def add_user(email: str, is_admin: bool = False) -> int:
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
@@ -76,7 +217,10 @@ def add_user(email: str, is_admin: bool = False) -> int:
             'UPDATE users SET is_admin = ? WHERE email = ?', (int(is_admin), email))
         conn.commit()
         cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
-        return cursor.fetchone()[0]
+        user_id = cursor.fetchone()[0]
+    for listener in _user_listeners:
+        listener(email)
+    return user_id
 
 
 def get_user(email: str) -> Optional[User]:
@@ -190,15 +334,28 @@ def delete_filter(filter_id: int) -> None:
 
 
 # Schedules
+# Called after any schedule is added, changed or deleted
+_schedule_listeners: List[Callable[[], None]] = []
+
+
+def add_schedule_listener(listener: Callable[[], None]) -> None:
+    _schedule_listeners.append(listener)
+
+
+def _notify_schedule_listeners() -> None:
+    for listener in _schedule_listeners:
+        listener()
+
+
 def get_schedules_for_user(user_id: int) -> List[Schedule]:
     schedules: List[Schedule] = []
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
-            '''SELECT id, user_id, name, monday, tuesday, wednesday, thursday, friday, saturday, sunday
+            '''SELECT id, user_id, name, monday, tuesday, wednesday, thursday, friday, saturday, sunday, only_new
                FROM schedules WHERE user_id = ?''', (user_id,))
         for row in cursor.fetchall():
-            schedules.append(Schedule(*row))
+            schedules.append(Schedule(*row[:-1], only_new=bool(row[-1])))
     return schedules
 
 
@@ -206,11 +363,10 @@ def get_schedule_by_id(schedule_id: int) -> Optional[Schedule]:
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
-            '''SELECT id, user_id, name, monday, tuesday, wednesday, thursday, friday, saturday, sunday
+            '''SELECT id, user_id, name, monday, tuesday, wednesday, thursday, friday, saturday, sunday, only_new
                FROM schedules WHERE id = ?''', (schedule_id,))
         row = cursor.fetchone()
-        print(row)
-        return Schedule(*row) if row else None
+        return Schedule(*row[:-1], only_new=bool(row[-1])) if row else None
 
 
 def add_schedule(user_id: int, schedule: Dict[str, str]) -> int:
@@ -219,8 +375,8 @@ def add_schedule(user_id: int, schedule: Dict[str, str]) -> int:
         cursor.execute('''
             INSERT INTO schedules (
                 user_id, name, monday, tuesday, wednesday,
-                thursday, friday, saturday, sunday
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                thursday, friday, saturday, sunday, only_new
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             user_id,
             schedule.get("name", ""),
@@ -230,13 +386,15 @@ def add_schedule(user_id: int, schedule: Dict[str, str]) -> int:
             schedule.get("Thursday"),
             schedule.get("Friday"),
             schedule.get("Saturday"),
-            schedule.get("Sunday")
+            schedule.get("Sunday"),
+            int(schedule.get("only_new", "0") or 0)
         ))
         conn.commit()
         result = cursor.lastrowid
         if result is None:
             raise RuntimeError("Failed to insert schedule")
-        return result
+    _notify_schedule_listeners()
+    return result
 
 
 def update_schedule(schedule_id: int, updates: Dict[str, str]) -> None:
@@ -256,36 +414,95 @@ def update_schedule(schedule_id: int, updates: Dict[str, str]) -> None:
             WHERE id = ?
         ''', values)
         conn.commit()
+    _notify_schedule_listeners()
 
 
 def delete_schedule(schedule_id: int) -> None:
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute('DELETE FROM schedules WHERE id = ?', (schedule_id,))
+        cursor.execute('DELETE FROM schedule_seen WHERE schedule_id = ?', (schedule_id,))
         conn.commit()
+    _notify_schedule_listeners()
+
+# Seen sets are stored as sorted, concatenated, zlib-compressed hashes of this length
+SEEN_HASH_BYTES = 8
+
+# Legacy rows have no status and were all successful
+DELIVERED = "(status IS NULL OR status = 'success')"
 
 def has_run_today(schedule_id: int, date_str: str) -> bool:
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT 1 FROM job_runs WHERE schedule_id = ? AND run_date = ?', (schedule_id, date_str))
+        cursor.execute(f'SELECT 1 FROM job_runs WHERE schedule_id = ? AND run_date = ? AND {DELIVERED}',
+                       (schedule_id, date_str))
         return cursor.fetchone() is not None
 
 def mark_as_run(schedule_id: int, date_str: str) -> None:
-    with sqlite3.connect(DB_PATH) as conn:
+    record_job_run(JobRun(schedule_id, date_str))
+
+def record_job_run(run: JobRun) -> None:
+    """Store a delivery attempt. Only successful runs count as the schedule having run."""
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
         cursor = conn.cursor()
-        cursor.execute('INSERT INTO job_runs (schedule_id, run_date) VALUES (?, ?)', (schedule_id, date_str))
+        cursor.execute('''
+            INSERT INTO job_runs (schedule_id, run_date, user_id, started_at, finished_at, status, stages,
+                                  corpus_size, match_count, email_bytes, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (run.schedule_id, run.run_date, run.user_id, run.started_at, run.finished_at, run.status,
+              json.dumps(run.stages), run.corpus_size, run.match_count, run.email_bytes, run.error))
         conn.commit()
 
+def pack_seen_hashes(seen: Iterable[bytes]) -> bytes:
+    return zlib.compress(b"".join(sorted(set(seen))))
+
+def get_seen_hashes(schedule_id: int) -> Set[bytes]:
+    """The SEEN_HASH_BYTES-long hashes saved when the schedule's last digest was sent."""
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT hashes FROM schedule_seen WHERE schedule_id = ?', (schedule_id,))
+        row = cursor.fetchone()
+    if row is None:
+        return set()
+    packed = zlib.decompress(row[0])
+    return {packed[i:i + SEEN_HASH_BYTES] for i in range(0, len(packed), SEEN_HASH_BYTES)}
+
+def get_recent_job_runs(limit: int = 20) -> List[JobRun]:
+    """Most recent timed runs first, with the user's email filled in."""
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT job_runs.schedule_id, job_runs.run_date, job_runs.user_id, job_runs.started_at,
+                   job_runs.finished_at, job_runs.status, job_runs.stages, job_runs.corpus_size,
+                   job_runs.match_count, job_runs.email_bytes, job_runs.error, job_runs.id, users.email
+            FROM job_runs LEFT JOIN users ON users.id = job_runs.user_id
+            WHERE job_runs.started_at IS NOT NULL
+            ORDER BY job_runs.started_at DESC LIMIT ?
+        ''', (limit,))
+        runs: List[JobRun] = []
+        for row in cursor.fetchall():
+            run = JobRun(*row)
+            run.stages = json.loads(row[6]) if row[6] else {}
+            runs.append(run)
+        return runs
+
+def get_last_run_dates() -> Dict[int, str]:
+    """Most recent run date for every schedule that has run, in one query."""
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT schedule_id, MAX(run_date) FROM job_runs WHERE {DELIVERED} GROUP BY schedule_id')
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
 def get_all_schedules() -> List[Schedule]:
     schedules: List[Schedule] = []
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT id, user_id, name, monday, tuesday, wednesday, thursday, friday, saturday, sunday
+            SELECT id, user_id, name, monday, tuesday, wednesday, thursday, friday, saturday, sunday, only_new
             FROM schedules
         ''')
         for row in cursor.fetchall():
-            schedules.append(Schedule(*row))
+            schedules.append(Schedule(*row[:-1], only_new=bool(row[-1])))
     return schedules
 
 def get_all_schedule_user_ids() -> List[int]:
@@ -296,6 +513,9 @@ def get_all_schedule_user_ids() -> List[int]:
 
 
 # Solicitations
+DB_SECONDS = Histogram("db_query_seconds", "Time spent in the heaviest solicitation queries")
+
+
 def setup_solicitations_table():
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
@@ -316,21 +536,65 @@ def setup_solicitations_table():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # Bumped whenever stored solicitations change, so caches can tell they're stale
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
         conn.commit()
 
 
+def _bump_corpus_generation(cursor: sqlite3.Cursor) -> None:
+    cursor.execute('''
+        INSERT INTO counters (name, value) VALUES ('corpus', 1)
+        ON CONFLICT(name) DO UPDATE SET value = value + 1
+    ''')
+
+
+def get_corpus_generation() -> int:
+    """A number that changes whenever any stored solicitation is added, changed or removed."""
+    setup_solicitations_table()
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT value FROM counters WHERE name = 'corpus'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+
+@traced("save_solicitations")
+@DB_SECONDS.time(query="save_solicitations")
 def save_solicitations(solicitations: Solicitations) -> None:
-    """Save a list of solicitations to the database."""
+    """Save a list of solicitations to the database, merging into existing rows."""
     setup_solicitations_table()
-    print(f"Saving {len(solicitations)} solicitations to database...")
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
+        changes_before = conn.total_changes
         for solicitation in solicitations:
+            # Upsert rather than REPLACE so existing rows keep their id and created_at,
+            # and skip rows that haven't changed so the corpus generation stays put
             cursor.execute('''
-                INSERT OR REPLACE INTO solicitations (
+                INSERT INTO solicitations (
                     solicitation_id, entity_name, state, open_date, department,
                     posted_date, title, status, solicitation_number, description, url
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(solicitation_id) DO UPDATE SET
+                    entity_name = excluded.entity_name,
+                    state = excluded.state,
+                    open_date = excluded.open_date,
+                    department = excluded.department,
+                    posted_date = excluded.posted_date,
+                    title = excluded.title,
+                    status = excluded.status,
+                    solicitation_number = excluded.solicitation_number,
+                    description = excluded.description,
+                    url = excluded.url
+                WHERE (entity_name, state, open_date, department, posted_date, title, status,
+                       solicitation_number, description, url)
+                   IS NOT (excluded.entity_name, excluded.state, excluded.open_date, excluded.department,
+                           excluded.posted_date, excluded.title, excluded.status,
+                           excluded.solicitation_number, excluded.description, excluded.url)
             ''', (
                 solicitation.solicitation_id or solicitation.Id,
                 solicitation.EntityName,
@@ -344,10 +608,15 @@ def save_solicitations(solicitations: Solicitations) -> None:
                 solicitation.description,
                 solicitation.url
             ))
+        changed = conn.total_changes - changes_before
+        if changed:
+            _bump_corpus_generation(cursor)
         conn.commit()
-    print(f"Successfully saved {len(solicitations)} solicitations to database")
+    log.debug("Saved solicitations", count=len(solicitations), changed=changed)
 
 
+@traced("get_all_solicitations")
+@DB_SECONDS.time(query="get_all_solicitations")
 def get_all_solicitations() -> Solicitations:
     """Get all solicitations from the database."""
     setup_solicitations_table()
@@ -362,7 +631,7 @@ def get_all_solicitations() -> Solicitations:
             ORDER BY created_at DESC
         ''')
         rows = cursor.fetchall()
-        print(f"Retrieved {len(rows)} solicitations from database")
+        log.debug("Retrieved solicitations", count=len(rows))
         for row in rows:
             solicitations.append(Solicitation(
                 Id=row[0] or "",
@@ -380,6 +649,58 @@ def get_all_solicitations() -> Solicitations:
     return solicitations
 
 
+SOLICITATION_COLUMNS = '''solicitation_id, entity_name, state, open_date, department,
+                   posted_date, title, status, solicitation_number, description, url'''
+
+
+def _solicitation_from_row(row: tuple) -> Solicitation:
+    return Solicitation(
+        Id=row[0] or "",
+        EntityName=row[1] or "",
+        state=row[2],
+        open_date=row[3],
+        department=row[4],
+        posted_date=row[5],
+        # The stored key, which save_solicitations takes from solicitation_id when the source has one
+        solicitation_id=row[0],
+        title=row[6],
+        status=row[7],
+        solicitation_number=row[8],
+        description=row[9],
+        url=row[10]
+    )
+
+
+def get_solicitations_by_ids(solicitation_ids: List[str]) -> Solicitations:
+    """Solicitations still stored, in the order of solicitation_ids."""
+    if not solicitation_ids:
+        return Solicitations()
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        placeholders = ", ".join("?" for _ in solicitation_ids)
+        cursor.execute(f'''
+            SELECT {SOLICITATION_COLUMNS}
+            FROM solicitations WHERE solicitation_id IN ({placeholders})
+        ''', solicitation_ids)
+        by_id = {row[0]: _solicitation_from_row(row) for row in cursor.fetchall()}
+    return Solicitations(by_id[i] for i in solicitation_ids if i in by_id)
+
+
+def get_solicitations_after(after_row_id: int, limit: int) -> List[Tuple[int, Solicitation]]:
+    """
+    Keyset page of solicitations in row id order, for paging without OFFSET.
+    :return: (row id, solicitation) pairs; pass the last row id back to get the next page
+    """
+    setup_solicitations_table()
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT id, {SOLICITATION_COLUMNS}
+            FROM solicitations WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_row_id, limit))
+        return [(row[0], _solicitation_from_row(row[1:])) for row in cursor.fetchall()]
+
+
 def get_solicitations_by_source(entity_name: str) -> Solicitations:
     """Get solicitations from a specific source."""
     setup_solicitations_table()
@@ -395,8 +716,7 @@ def get_solicitations_by_source(entity_name: str) -> Solicitations:
             ORDER BY created_at DESC
         ''', (entity_name,))
         rows = cursor.fetchall()
-        print(
-            f"Retrieved {len(rows)} solicitations from database for source: {entity_name}")
+        log.debug("Retrieved solicitations", count=len(rows), source=entity_name)
         for row in rows:
             solicitations.append(Solicitation(
                 Id=row[0] or "",
@@ -421,6 +741,7 @@ def clear_solicitations_by_source(entity_name: str) -> None:
         cursor = conn.cursor()
         cursor.execute(
             'DELETE FROM solicitations WHERE entity_name = ?', (entity_name,))
+        _bump_corpus_generation(cursor)
         conn.commit()
 
 
@@ -430,4 +751,510 @@ def clear_all_solicitations() -> None:
     with sqlite3.connect(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute('DELETE FROM solicitations')
+        _bump_corpus_generation(cursor)
+        conn.commit()
+
+
+def delete_solicitations_not_in(entity_name: str, keep_ids: Iterable[str]) -> int:
+    """Delete solicitations from a source whose id is not in keep_ids. Returns the number removed."""
+    setup_solicitations_table()
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('CREATE TEMP TABLE keep_ids (solicitation_id TEXT PRIMARY KEY)')
+        cursor.executemany('INSERT OR IGNORE INTO keep_ids VALUES (?)',
+                           ((id_,) for id_ in keep_ids))
+        cursor.execute('''
+            DELETE FROM solicitations
+            WHERE entity_name = ?
+              AND solicitation_id NOT IN (SELECT solicitation_id FROM keep_ids)
+        ''', (entity_name,))
+        removed = cursor.rowcount
+        if removed:
+            _bump_corpus_generation(cursor)
+        conn.commit()
+        return removed
+
+
+# Source sync state
+def get_source_state(source: str) -> Optional[SourceState]:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT source, watermark, last_full_sync, last_success FROM source_state WHERE source = ?', (source,))
+        row = cursor.fetchone()
+        return SourceState(*row) if row else None
+
+
+def set_source_watermark(source: str, watermark: str, full_sync: bool = False) -> None:
+    """Record a successful fetch. A full sync also moves the reconciliation timestamp."""
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO source_state (source, watermark, last_full_sync)
+            VALUES (?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET
+                watermark = excluded.watermark,
+                last_full_sync = COALESCE(excluded.last_full_sync, last_full_sync)
+        ''', (source, watermark, watermark if full_sync else None))
+        conn.commit()
+
+
+# Solicitations whose fetch failed with a retryable error, kept for the next refresh
+def defer_solicitations(source: str, solicitations: Solicitations, error: str) -> None:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO deferred_solicitations (source, solicitation_id, payload, last_error, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(source, solicitation_id) DO UPDATE SET
+                payload = excluded.payload,
+                attempts = attempts + 1,
+                last_error = excluded.last_error,
+                updated_at = excluded.updated_at
+        ''', [(source, s.solicitation_id or s.Id, json.dumps(asdict(s)), error, time.time())
+              for s in solicitations])
+        conn.commit()
+
+
+def get_deferred_solicitations(source: str) -> Solicitations:
+    from data_sources.Solicitation import Solicitation
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT payload FROM deferred_solicitations WHERE source = ?', (source,))
+        return Solicitations(Solicitation(**json.loads(row[0])) for row in cursor.fetchall())
+
+
+def clear_deferred_solicitations(source: str, solicitation_ids: Iterable[str]) -> None:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            'DELETE FROM deferred_solicitations WHERE source = ? AND solicitation_id = ?',
+            [(source, id_) for id_ in solicitation_ids])
+        conn.commit()
+
+
+def mark_source_refreshed(source: str, finished_at: float) -> None:
+    """Record when a source last refreshed successfully (a Unix timestamp)."""
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO source_state (source, last_success) VALUES (?, ?)
+            ON CONFLICT(source) DO UPDATE SET last_success = excluded.last_success
+        ''', (source, finished_at))
+        conn.commit()
+
+
+def get_all_source_states() -> List[SourceState]:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT source, watermark, last_full_sync, last_success FROM source_state ORDER BY source')
+        return [SourceState(*row) for row in cursor.fetchall()]
+
+
+def record_refresh_run(source: str, started_at: float, finished_at: float, status: str,
+                       error: Optional[str] = None) -> None:
+    """Log one refresh attempt, along with how many rows the source has afterwards."""
+    setup_solicitations_table()
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM solicitations WHERE entity_name = ?', (source,))
+        record_count = cursor.fetchone()[0]
+        cursor.execute('''
+            INSERT INTO refresh_runs (source, started_at, finished_at, status, record_count, error)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (source, started_at, finished_at, status, record_count, error))
+        conn.commit()
+
+
+def get_recent_refresh_runs(limit: int = 20) -> List[RefreshRun]:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, source, started_at, finished_at, status, record_count, error
+            FROM refresh_runs ORDER BY started_at DESC LIMIT ?
+        ''', (limit,))
+        return [RefreshRun(*row) for row in cursor.fetchall()]
+
+
+# Locks shared by every process using the database
+def acquire_lock(name: str, owner: str, ttl_seconds: float) -> bool:
+    """Take the named lock unless someone else holds an unexpired one. Re-acquiring extends it."""
+    now = time.time()
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        # A single upsert statement is atomic, so two workers can't both win
+        cursor.execute('''
+            INSERT INTO locks (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE locks.expires_at < ? OR locks.owner = excluded.owner
+        ''', (name, owner, now + ttl_seconds, now))
+        conn.commit()
+        return cursor.rowcount == 1
+
+
+def release_lock(name: str, owner: str) -> None:
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, owner))
+        conn.commit()
+
+
+def is_locked(name: str) -> bool:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM locks WHERE name = ? AND expires_at >= ?', (name, time.time()))
+        return cursor.fetchone() is not None
+
+
+# Job queue. Jobs are claimed under a lease that the worker renews while it
+# runs; a job whose lease runs out (its worker died) is claimed again.
+JOB_COLUMNS = 'id, kind, payload, status, attempts, max_attempts, lease_owner, lease_expires, last_error, progress'
+
+
+def enqueue_job(kind: str, payload: Dict[str, object], dedupe_key: Optional[str] = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> Optional[int]:
+    """
+    Queue a job. Returns its id, or None if a job with the same dedupe_key already exists.
+    Finished and failed jobs older than JOB_RETENTION_DAYS are dropped, freeing their keys.
+    """
+    now = time.time()
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?
+        ''', (now - JOB_RETENTION_DAYS * 86400,))
+        cursor.execute('''
+            INSERT OR IGNORE INTO jobs (kind, payload, dedupe_key, max_attempts, run_after, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, json.dumps(payload), dedupe_key, max_attempts, now, now, now))
+        conn.commit()
+        return cursor.lastrowid if cursor.rowcount == 1 else None
+
+
+def enqueue_shared_job(kind: str, payload: Dict[str, object], dedupe_key: str,
+                       max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+    """
+    Queue a job unless one with the same dedupe_key is still queued or running.
+    Unlike enqueue_job, a finished job gives its key up, so the next call queues a new one.
+    :return: The id of the new job, or of the unfinished one to share
+    """
+    now = time.time()
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            UPDATE jobs SET dedupe_key = NULL WHERE dedupe_key = ? AND status IN ('done', 'failed')
+        ''', (dedupe_key,))
+        cursor.execute('''
+            INSERT OR IGNORE INTO jobs (kind, payload, dedupe_key, max_attempts, run_after, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, json.dumps(payload), dedupe_key, max_attempts, now, now, now))
+        cursor.execute('SELECT id FROM jobs WHERE dedupe_key = ?', (dedupe_key,))
+        job_id = cursor.fetchone()[0]
+        cursor.execute('COMMIT')
+        return job_id
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def claim_job(owner: str, lease_seconds: float) -> Optional[Job]:
+    """Atomically take the oldest runnable job, including ones whose lease expired."""
+    now = time.time()
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        # IMMEDIATE takes the write lock up front so two workers can't pick the same row
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            UPDATE jobs SET status = 'failed', last_error = 'lease expired', updated_at = ?
+            WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts
+        ''', (now, now))
+        cursor.execute(f'''
+            SELECT {JOB_COLUMNS} FROM jobs
+            WHERE (status = 'queued' AND run_after <= ?)
+               OR (status = 'running' AND lease_expires < ?)
+            ORDER BY run_after, id LIMIT 1
+        ''', (now, now))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('COMMIT')
+            return None
+        cursor.execute('''
+            UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?,
+                attempts = attempts + 1, updated_at = ?
+            WHERE id = ?
+        ''', (owner, now + lease_seconds, now, row[0]))
+        cursor.execute('COMMIT')
+        job = Job(*row)
+        job.status, job.attempts, job.lease_owner, job.lease_expires = 'running', job.attempts + 1, owner, now + lease_seconds
+        return job
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def heartbeat_job(job_id: int, owner: str, lease_seconds: float) -> bool:
+    """Extend a running job's lease. Returns False if the job is no longer ours."""
+    now = time.time()
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET lease_expires = ?, updated_at = ?
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+        ''', (now + lease_seconds, now, job_id, owner))
+        conn.commit()
+        return cursor.rowcount == 1
+
+
+def job_lease_held(job_id: int, owner: str) -> bool:
+    """Whether owner still holds a running job's lease, i.e. it hasn't expired, timed out or been reclaimed."""
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT 1 FROM jobs WHERE id = ? AND lease_owner = ? AND status = 'running' AND lease_expires > ?
+        ''', (job_id, owner, time.time()))
+        return cursor.fetchone() is not None
+
+
+def set_job_progress(job_id: int, progress: str) -> None:
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?', (progress, time.time(), job_id))
+        conn.commit()
+
+
+def get_job(job_id: int) -> Optional[Job]:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        return Job(*row) if row else None
+
+
+def complete_job(job_id: int, owner: str) -> None:
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL, updated_at = ?
+            WHERE id = ? AND lease_owner = ?
+        ''', (time.time(), job_id, owner))
+        conn.commit()
+
+
+def fail_job(job_id: int, owner: str, error: str, retry_delay: Optional[float]) -> bool:
+    """
+    Record a failed attempt. The job is queued again after retry_delay seconds
+    unless it is out of attempts or retry_delay is None.
+    :return: Whether the job will be retried
+    """
+    now = time.time()
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        if retry_delay is not None:
+            cursor.execute('''
+                UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires = NULL,
+                    run_after = ?, last_error = ?, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND attempts < max_attempts
+            ''', (now + retry_delay, error, now, job_id, owner))
+            if cursor.rowcount == 1:
+                conn.commit()
+                return True
+        cursor.execute('''
+            UPDATE jobs SET status = 'failed', lease_owner = NULL, lease_expires = NULL,
+                last_error = ?, updated_at = ?
+            WHERE id = ? AND lease_owner = ?
+        ''', (error, now, job_id, owner))
+        conn.commit()
+        return False
+
+
+# Outgoing mail. Senders claim a batch under a lease like jobs do, lowest
+# priority number first, so a crashed sender's messages go out again.
+def enqueue_email(to_address: str, subject: str, message: str, priority: int, max_attempts: int,
+                  schedule_id: Optional[int] = None, seen: Optional[Iterable[bytes]] = None,
+                  run_date: Optional[str] = None) -> None:
+    """
+    Queue a message. Sent and failed messages older than OUTBOX_RETENTION_DAYS are dropped.
+    :param seen: The seen set of schedule_id's only_new digest, saved by mark_email_sent once it is sent
+    :param run_date: The day of schedule_id's digest; a second digest for the same day is ignored
+    """
+    now = time.time()
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM outbox WHERE status IN ('sent', 'failed') AND created_at < ?
+        ''', (now - OUTBOX_RETENTION_DAYS * 86400,))
+        cursor.execute('''
+            INSERT OR IGNORE INTO outbox (to_address, subject, message, priority, max_attempts, run_after,
+                                          created_at, schedule_id, seen_hashes, run_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (to_address, subject, message, priority, max_attempts, now, now,
+              schedule_id, pack_seen_hashes(seen) if seen is not None else None, run_date))
+        conn.commit()
+
+
+def claim_emails(owner: str, limit: int, lease_seconds: float,
+                 max_priority: Optional[int] = None) -> List[OutboxEmail]:
+    """
+    Atomically take up to limit sendable messages of the most urgent priority waiting.
+    :param max_priority: Only take messages at least this urgent
+    """
+    now = time.time()
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            UPDATE outbox SET status = 'failed', last_error = 'lease expired'
+            WHERE status = 'sending' AND lease_expires < ? AND attempts >= max_attempts
+        ''', (now,))
+        sendable = '''
+            ((status = 'queued' AND run_after <= ?) OR (status = 'sending' AND lease_expires < ?))
+              AND (? IS NULL OR priority <= ?)
+        '''
+        cursor.execute(f'SELECT MIN(priority) FROM outbox WHERE {sendable}', (now, now, max_priority, max_priority))
+        priority = cursor.fetchone()[0]
+        if priority is None:
+            cursor.execute('COMMIT')
+            return []
+        # One priority per batch, so a digest batch never holds up a login link
+        cursor.execute(f'''
+            SELECT id, to_address, subject, message, priority, attempts, max_attempts FROM outbox
+            WHERE {sendable} AND priority = ?
+            ORDER BY run_after, id LIMIT ?
+        ''', (now, now, max_priority, max_priority, priority, limit))
+        emails = [OutboxEmail(*row) for row in cursor.fetchall()]
+        cursor.executemany('''
+            UPDATE outbox SET status = 'sending', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+            WHERE id = ?
+        ''', [(owner, now + lease_seconds, email.id) for email in emails])
+        cursor.execute('COMMIT')
+        for email in emails:
+            email.attempts += 1
+        return emails
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def mark_email_sent(email_id: int, owner: str) -> None:
+    """
+    Record a sent message, and for an only_new digest advance its schedule's seen set.
+    Does nothing if owner's lease expired and another sender has claimed the message since.
+    """
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE outbox SET status = 'sent', sent_at = ?, lease_owner = NULL, lease_expires = NULL
+            WHERE id = ? AND lease_owner = ?
+        ''', (time.time(), email_id, owner))
+        if cursor.rowcount == 0:
+            return
+        # Keyed on when the digest was queued, so an older digest sent late after
+        # retries doesn't replace a newer one's seen set
+        cursor.execute('''
+            INSERT INTO schedule_seen (schedule_id, hashes, updated_at)
+            SELECT schedule_id, seen_hashes, created_at FROM outbox
+            WHERE id = ? AND seen_hashes IS NOT NULL
+              AND schedule_id IN (SELECT id FROM schedules)
+            ON CONFLICT(schedule_id) DO UPDATE SET hashes = excluded.hashes, updated_at = excluded.updated_at
+            WHERE excluded.updated_at > schedule_seen.updated_at
+        ''', (email_id,))
         conn.commit()
+
+
+def fail_email(email_id: int, owner: str, error: str, retry_delay: float) -> bool:
+    """
+    Record a failed send, queueing it again after retry_delay seconds unless it is out of attempts.
+    Does nothing if another sender has claimed the message since owner's lease expired.
+    :return: Whether the message will be retried
+    """
+    now = time.time()
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE outbox SET
+                status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                run_after = ?, last_error = ?, lease_owner = NULL, lease_expires = NULL
+            WHERE id = ? AND lease_owner = ?
+        ''', (now + retry_delay, error, email_id, owner))
+        if cursor.rowcount == 0:
+            return False
+        cursor.execute('SELECT status FROM outbox WHERE id = ?', (email_id,))
+        row = cursor.fetchone()
+        conn.commit()
+        return row is not None and row[0] == 'queued'
+
+
+def get_outbox_counts() -> Dict[str, int]:
+    """Number of messages in each status, e.g. {"queued": 3, "sent": 120}."""
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status')
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+# Full result sets behind truncated digest emails, linked from the email
+def save_digest(user_id: int, solicitation_ids: List[str]) -> str:
+    """Store a result set and return its unguessable id. Sets older than DIGEST_RETENTION_DAYS are dropped."""
+    digest_id = secrets.token_urlsafe(16)
+    now = time.time()
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM digests WHERE created_at < ?', (now - DIGEST_RETENTION_DAYS * 86400,))
+        cursor.execute(
+            'INSERT INTO digests (id, user_id, created_at, solicitation_ids) VALUES (?, ?, ?, ?)',
+            (digest_id, user_id, now, json.dumps(solicitation_ids)))
+        conn.commit()
+    return digest_id
+
+
+def get_digest(digest_id: str) -> Optional[Digest]:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, user_id, created_at, solicitation_ids FROM digests WHERE id = ?', (digest_id,))
+        row = cursor.fetchone()
+    return Digest(row[0], row[1], row[2], json.loads(row[3])) if row else None
+
+
+# Metrics from every process, summed as each one flushes. A row is one sample of
+# a series: a counter's value, or a histogram's bucket count, sum or count.
+MetricRow = Tuple[str, str, str, str, float]
+
+
+def add_metric_samples(added: List[MetricRow], replaced: List[MetricRow]) -> None:
+    """
+    :param added: (name, kind, labels, sample, amount) to add to the stored value
+    :param replaced: (name, kind, labels, sample, value) to store as is, e.g. gauges
+    """
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO metrics (name, kind, labels, sample, value) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(name, labels, sample) DO UPDATE SET value = value + excluded.value
+        ''', added)
+        cursor.executemany('''
+            INSERT INTO metrics (name, kind, labels, sample, value) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(name, labels, sample) DO UPDATE SET value = excluded.value
+        ''', replaced)
+        conn.commit()
+
+
+def get_metric_samples() -> List[MetricRow]:
+    with sqlite3.connect(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, kind, labels, sample, value FROM metrics ORDER BY name, labels')
+        return cursor.fetchall()
@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
 
 @dataclass
@@ -27,6 +27,8 @@ class Schedule:
     friday: Optional[str]
     saturday: Optional[str]
     sunday: Optional[str]
+    # Only deliver solicitations that are new or changed since the last delivery
+    only_new: bool = False
 
 
 @dataclass
@@ -35,3 +37,85 @@ class Filter:
     user_id: int
     name: str
     criteria: str
+
+
+@dataclass
+class SourceState:
+    source: str
+    watermark: Optional[str] = None
+    last_full_sync: Optional[str] = None
+    last_success: Optional[float] = None
+
+
+@dataclass
+class RefreshRun:
+    id: int
+    source: str
+    started_at: float
+    finished_at: float
+    status: str
+    record_count: Optional[int] = None
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class JobRun:
+    """One scheduled digest delivery, with the seconds spent in each stage."""
+    schedule_id: int
+    run_date: str
+    user_id: Optional[int] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    status: str = "success"
+    stages: Dict[str, float] = field(default_factory=dict)
+    corpus_size: Optional[int] = None
+    match_count: Optional[int] = None
+    email_bytes: Optional[int] = None
+    error: Optional[str] = None
+    id: Optional[int] = None
+    user_email: Optional[str] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: str
+    status: str
+    attempts: int
+    max_attempts: int
+    lease_owner: Optional[str] = None
+    lease_expires: Optional[float] = None
+    last_error: Optional[str] = None
+    # What the job is doing now, for jobs a user is watching
+    progress: Optional[str] = None
+
+
+@dataclass
+class OutboxEmail:
+    id: int
+    to_address: str
+    subject: str
+    message: str
+    priority: int
+    attempts: int
+    max_attempts: int
+
+
+@dataclass
+class Digest:
+    """The full result set behind a truncated digest email."""
+    id: str
+    user_id: int
+    created_at: float
+    solicitation_ids: List[str]
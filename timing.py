@@ -0,0 +1,56 @@
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of values (pct between 0 and 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """Count, p50, p95 and max of a list of durations."""
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def summarize_stages(runs: Iterable[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Summarize each stage's durations across runs, e.g. every delivery's StageTimer.stages."""
+    by_stage: Dict[str, List[float]] = {}
+    for stages in runs:
+        for name, seconds in stages.items():
+            by_stage.setdefault(name, []).append(seconds)
+    return {name: summarize(values) for name, values in by_stage.items()}
+
+
+class StageTimer:
+    """
+    Add up the time spent in each named stage of a run:
+
+        timer = StageTimer()
+        with timer.stage("filter"):
+            ...
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages: Dict[str, float] = {}
+        # Sizes worth keeping alongside the timings, e.g. records filtered
+        self.counts: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - start